@@ -14,7 +14,14 @@ from . import (
 
 
 class Backend:
-    def __init__(self, simulated=False, competition=False, scheduler=""):
+    def __init__(
+        self,
+        simulated=False,
+        competition=False,
+        scheduler="",
+        source=None,
+        realtime=True,
+    ):
         super().__init__()
         robots.Robots.protocols["serial"] = robot_serial.RobotSerial
         robots.Robots.protocols["wifi"] = robot_wifi.RobotWifi
@@ -37,7 +44,7 @@ class Backend:
             )
         else:
             self.robots.load_config()
-            self.video: video.Video = video.Video()
+            self.video: video.Video = video.Video(source, realtime)
 
             self.detection: detection.Detection = self.video.detection
             self.detection.state = self.state
@@ -55,8 +62,8 @@ class Backend:
     def is_simulated(self):
         return self.simulated
 
-    def cameras(self):
-        return self.video.cameras()
+    def cameras(self, refresh: bool = False):
+        return self.video.cameras(refresh)
 
     def constants(self) -> dict:
         # Retrieving all values declared in constants.py
@@ -82,27 +89,60 @@ class Backend:
     def resolutions(self):
         return self.video.resolutions()
 
-    def getCameraSettings(self):
-        return self.video.settings
+    def getCameraSettings(self, camera: str = ""):
+        return self.video.get_camera(camera).settings
 
-    def start_capture(self, index: int, res: int) -> bool:
-        return self.video.start_capture(index, res)
+    def start_capture(self, index: int, res: int, camera: str = "") -> bool:
+        return self.video.get_camera(camera).start_capture(index, res)
 
     def stop_capture(self):
         self.video.stop_capture()
 
-    def get_image(self) -> str:
-        image = self.video.get_image()
+    def get_image(self, tier: str = "full") -> str:
+        image = self.video.get_image(tier)
         return image
 
     def get_video(self, with_image: bool) -> dict:
         return self.video.get_video(with_image)
 
+    def get_video_timings(self) -> dict:
+        return self.video.get_timings()
+
     def enableVideoDebug(self, enable=True) -> bool:
         self.video.debug = enable
 
-    def cameraSettings(self, settings):
-        self.video.set_camera_settings(settings)
+    def add_camera(self, source: str) -> str:
+        return self.video.add_camera(source)
+
+    def remove_camera(self, name: str) -> bool:
+        return self.video.remove_camera(name)
+
+    def start_recording(self, name: str = "", debug: bool = False) -> bool:
+        return self.video.start_recording(name, debug)
+
+    def stop_recording(self) -> dict:
+        return self.video.stop_recording()
+
+    def get_video_options(self, camera: str = "") -> dict:
+        return self.video.get_camera(camera).options
+
+    def set_video_option(self, name: str, value, camera: str = ""):
+        self.video.get_camera(camera).set_option(name, value)
+
+    def get_marker_hold_time(self) -> float:
+        return self.state.marker_hold_time
+
+    def set_marker_hold_time(self, duration: float):
+        self.state.set_marker_hold_time(duration)
+
+    def get_filtering(self) -> bool:
+        return self.state.filtering
+
+    def set_filtering(self, enabled: bool):
+        self.state.set_filtering(enabled)
+
+    def cameraSettings(self, settings, camera: str = ""):
+        self.video.get_camera(camera).set_camera_settings(settings)
         return True
 
     def available_urls(self):
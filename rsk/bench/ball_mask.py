@@ -0,0 +1,155 @@
+"""
+Compares the HSV conversion used to compute the ball mask with BGR lookup tables, for each
+available capture resolution: a full table (2^24 entries, applied on the packed pixels) and
+cache-resident tables quantizing each channel to 6 and 5 bits (applied with a single indexed
+lookup). The agreement of the quantized tables masks with the HSV mask is reported.
+
+None of the tables was faster than OpenCV's (SIMD) HSV conversion and threshold, so the
+vision only uses the latter.
+
+Usage: python -m rsk.bench.ball_mask [--iterations N]
+"""
+
+import argparse
+import time
+import numpy as np
+import cv2
+from .. import detection, video
+
+
+def field_image(width: int, height: int) -> np.ndarray:
+    """
+    Builds a field-like image: noisy green carpet with a few orange blobs
+
+    :param int width: image width
+    :param int height: image height
+    :return np.ndarray: the (BGR) image
+    """
+    rng = np.random.default_rng(0)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = (40, 120, 40)
+    noise = rng.integers(-30, 30, size=image.shape)
+    image = np.clip(image + noise, 0, 255).astype(np.uint8)
+
+    for k in range(5):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, max(2, width // 100), (0, 128, 255), -1)
+
+    return image
+
+
+def build_lut(lower, upper, bits: int = 8) -> np.ndarray:
+    """
+    Builds a BGR -> mask lookup table, each channel being quantized to a number of bits (the
+    center of each bin being thresholded). The table is indexed by b | g << bits | r << 2 bits.
+
+    :param lower: the lower (H, S, V) thresholds
+    :param upper: the upper (H, S, V) thresholds
+    :param int bits: bits per channel
+    :return np.ndarray: the table
+    """
+    shift = 8 - bits
+    values = np.arange(1 << (3 * bits), dtype=np.uint32)
+    colors = np.empty((len(values), 1, 3), dtype=np.uint8)
+    for channel in range(3):
+        bins = (values >> (channel * bits)) & ((1 << bits) - 1)
+        colors[:, 0, channel] = (bins << shift) | ((1 << shift) >> 1)
+    hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+
+    return cv2.inRange(hsv, np.array(lower), np.array(upper)).ravel()
+
+
+def full_lut_mask(table: np.ndarray, buffer: np.ndarray):
+    """
+    Mask using the full table: pixels are copied into a 4 channels buffer whose last channel
+    is always 0, so that it can be viewed as packed 32 bits indexes
+    """
+
+    def mask(image):
+        cv2.mixChannels([image], [buffer], [0, 0, 1, 1, 2, 2])
+        return table.take(buffer.view(np.uint32)[..., 0])
+
+    return mask
+
+
+def quantized_lut_mask(table: np.ndarray, bits: int):
+    """
+    Mask using a quantized table, the (16 bits) indexes being computed from the pixels
+    """
+    shift = 8 - bits
+
+    def mask(image):
+        quantized = image >> shift
+        indexes = quantized[..., 2].astype(np.uint16) << (2 * bits)
+        indexes |= quantized[..., 1].astype(np.uint16) << bits
+        indexes |= quantized[..., 0]
+        return table.take(indexes)
+
+    return mask
+
+
+def measure(func, image, iterations: int) -> float:
+    """
+    Measures the average duration of func(image)
+
+    :return float: duration [ms]
+    """
+    func(image)
+    t0 = time.perf_counter()
+    for k in range(iterations):
+        func(image)
+
+    return 1000 * (time.perf_counter() - t0) / iterations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", "-i", type=int, default=20)
+    args = parser.parse_args()
+
+    hsv = detection.Detection()
+    tables = {}
+    for bits in [8, 6, 5]:
+        t0 = time.perf_counter()
+        tables[bits] = build_lut(hsv.lower_orange, hsv.upper_orange, bits)
+        print(
+            "%d entries lookup table built in %.1f ms"
+            % (len(tables[bits]), 1000 * (time.perf_counter() - t0))
+        )
+    print()
+    print(
+        "%12s %10s %10s %10s %10s %8s %8s"
+        % (
+            "resolution",
+            "hsv [ms]",
+            "lut24 [ms]",
+            "lut18 [ms]",
+            "lut15 [ms]",
+            "lut18 %",
+            "lut15 %",
+        )
+    )
+
+    for width, height in video.resolutions:
+        image = field_image(width, height)
+        buffer = np.zeros((height, width, 4), dtype=np.uint8)
+        methods = [
+            hsv.ball_mask,
+            full_lut_mask(tables[8], buffer),
+            quantized_lut_mask(tables[6], 6),
+            quantized_lut_mask(tables[5], 5),
+        ]
+
+        reference = hsv.ball_mask(image)
+        assert np.array_equal(methods[1](image), reference)
+        agreements = [
+            100 * np.mean(method(image) == reference) for method in methods[2:]
+        ]
+        durations = [measure(method, image, args.iterations) for method in methods]
+
+        print(
+            "%12s %10.2f %10.2f %10.2f %10.2f %8.2f %8.2f"
+            % ("%dx%d" % (width, height), *durations, *agreements)
+        )
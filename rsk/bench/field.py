@@ -0,0 +1,125 @@
+"""
+Measures the speedup of the homography fast path of Field, and checks that its results are
+matching the full projection.
+
+Usage: python -m rsk.bench.field [--iterations N]
+"""
+
+import argparse
+import time
+import numpy as np
+import cv2
+from .. import field, constants
+
+
+def calibrated_field(width: int = 1920, height: int = 1080) -> field.Field:
+    """
+    Builds a field calibrated from the corners seen by a virtual camera, 2m above the field
+    and slightly tilted
+
+    :param int width: image width
+    :param int height: image height
+    :return field.Field: the calibrated field
+    """
+    calibrated = field.Field()
+    calibrated.focal = 885 * height / 1080
+
+    intrinsic = np.array(
+        [
+            [calibrated.focal, 0, width / 2],
+            [0, calibrated.focal, height / 2],
+            [0, 0, 1],
+        ]
+    )
+    rvec, _ = cv2.Rodrigues(
+        cv2.Rodrigues(np.array([0.05, -0.03, 0.01]))[0] @ np.diag([1.0, -1.0, -1.0])
+    )
+    tvec = np.array([0.02, -0.01, 2.0])
+
+    for corner, positions in calibrated.corner_field_positions.items():
+        points = np.array([[*position, 0.0] for position in positions])
+        pixels, _ = cv2.projectPoints(points, rvec, tvec, intrinsic, None)
+        calibrated.set_corner_position(corner, pixels.reshape(-1, 2))
+
+    calibrated.update_calibration(np.zeros((height, width, 3), dtype=np.uint8))
+
+    return calibrated
+
+
+def measure(func, iterations: int) -> float:
+    """
+    Measures the average duration of func()
+
+    :return float: duration [us]
+    """
+    func()
+    t0 = time.perf_counter()
+    for k in range(iterations):
+        func()
+
+    return 1e6 * (time.perf_counter() - t0) / iterations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--iterations", "-i", type=int, default=2000)
+    args = parser.parse_args()
+
+    calibrated = calibrated_field()
+    rng = np.random.default_rng(0)
+    pixels = rng.uniform([0, 0], [1920, 1080], size=(17, 2))
+    positions = rng.uniform([-1, -0.7], [1, 0.7], size=(17, 2))
+    positions = np.hstack((positions, np.full((17, 1), constants.robot_height)))
+    corners = pixels[:4]
+
+    benchmarks = {
+        "pixel_to_position": lambda: calibrated.pixel_to_position(
+            pixels[0], constants.ball_height
+        ),
+        "position_to_pixel": lambda: calibrated.position_to_pixel(positions[0]),
+        "pose_of_tag": lambda: calibrated.pose_of_tag(corners),
+        "pixels_to_positions (17)": lambda: calibrated.pixels_to_positions(
+            pixels, constants.ball_height
+        ),
+        "positions_to_pixels (17)": lambda: calibrated.positions_to_pixels(positions),
+    }
+
+    print("%26s %12s %12s %8s" % ("", "full [us]", "homog. [us]", "speedup"))
+    for name, func in benchmarks.items():
+        calibrated.use_homographies = False
+        full = measure(func, args.iterations)
+        calibrated.use_homographies = True
+        homography = measure(func, args.iterations)
+        print("%26s %12.1f %12.1f %8.2f" % (name, full, homography, full / homography))
+
+    # Checking the results
+    results = {}
+    for use_homographies in [False, True]:
+        calibrated.use_homographies = use_homographies
+        results[use_homographies] = (
+            calibrated.pixels_to_positions(pixels, constants.robot_height),
+            calibrated.positions_to_pixels(positions),
+            np.array(
+                [calibrated.pixel_to_position(p, constants.ball_height) for p in pixels]
+            ),
+            np.array([calibrated.position_to_pixel(p) for p in positions]),
+        )
+
+    print()
+    print("Maximum differences between full projection and homographies:")
+    print(
+        "  pixels -> positions: %g m"
+        % max(
+            np.max(np.abs(results[False][0] - results[True][0])),
+            np.max(np.abs(results[False][2] - results[True][2])),
+        )
+    )
+    print(
+        "  positions -> pixels: %d px"
+        % max(
+            np.max(np.abs(results[False][1] - results[True][1])),
+            np.max(np.abs(results[False][3] - results[True][3])),
+        )
+    )
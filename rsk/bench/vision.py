@@ -0,0 +1,285 @@
+"""
+Replays frames through the vision (markers detection and field calibration, ball detection and
+annotations) and reports stages durations, frame rate and, for synthetic frames, markers and
+ball recall and pose errors against the ground truth, as JSON.
+
+Usage: python -m rsk.bench.vision [--source SOURCE] [--resolution WxH ...] [--frames N]
+                                  [--warmup N] [--tracking] [--ball-windowing]
+                                  [--recalibrate] [--noise SIGMA] [--output FILE]
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+from .. import detection, render, sources, state, timings, constants, utils
+
+
+class GameReferee:
+    """
+    Stands for the referee in the annotations (team sides, penalty spots and ball placement),
+    without starting its threads and sockets
+    """
+
+    def __init__(self):
+        self.positive_team, self.negative_team = utils.robot_teams()
+        self.wait_ball_position = None
+        self.penalty_spot = [
+            {
+                "robot": None,
+                "last_use": 0,
+                "pos": (
+                    x,
+                    side * (constants.field_width / 2 + constants.robot_radius),
+                    side * np.pi / 2,
+                ),
+            }
+            for x in np.linspace(
+                -constants.field_length / 2,
+                constants.field_length / 2,
+                constants.penalty_spots // 2 + 2,
+            )[1:-1]
+            for side in (-1, 1)
+        ]
+
+
+def synthetic_scene(index: int) -> dict:
+    """
+    Scene of a synthetic frame: robots moving on circles and the ball bouncing in the field
+
+    :param int index: the frame index
+    :return dict: the objects poses (see render.poses)
+    """
+    t = index / 30
+    objects = {}
+    for k, (team, number) in enumerate(utils.all_robots()):
+        angle = 0.5 * t + k * np.pi / 2
+        center = [(-1) ** k * 0.35, (-1) ** (k // 2) * 0.25]
+        objects[utils.robot_list2str(team, number)] = (
+            center[0] + 0.2 * np.cos(angle),
+            center[1] + 0.2 * np.sin(angle),
+            utils.angle_wrap(angle + np.pi / 2),
+        )
+
+    # Ball bouncing between the field borders
+    x_max = constants.field_length / 2 - constants.ball_radius
+    y_max = constants.field_width / 2 - constants.ball_radius
+    x = (0.1 + 0.6 * t) % (4 * x_max)
+    y = (0.3 + 0.45 * t) % (4 * y_max)
+    objects["ball"] = (
+        2 * x_max - abs(x - 2 * x_max) - x_max,
+        2 * y_max - abs(y - 2 * y_max) - y_max,
+        0.0,
+    )
+
+    return objects
+
+
+def percentiles(values: list) -> dict:
+    """
+    Statistics of errors
+
+    :param list values: the errors
+    :return dict: mean, p50, p95 and max (None if there is no value)
+    """
+    if not values:
+        return None
+
+    p50, p95 = np.percentile(values, [50, 95])
+    return {
+        "mean": float(np.mean(values)),
+        "p50": float(p50),
+        "p95": float(p95),
+        "max": float(np.max(values)),
+    }
+
+
+def run(
+    source: str = None,
+    resolution: tuple = (1920, 1080),
+    frames: int = 300,
+    warmup: int = 10,
+    tracking: bool = False,
+    ball_windowing: bool = False,
+    recalibrate: bool = False,
+    noise: float = 2,
+) -> dict:
+    """
+    Runs the benchmark
+
+    :param str source: frame source (see sources.open_source), None for synthetic frames
+    :param tuple resolution: synthetic frames resolution (width, height)
+    :param int frames: number of measured frames
+    :param int warmup: number of frames processed before measuring
+    :param bool tracking: enables markers tracking
+    :param bool ball_windowing: enables ball windowing
+    :param bool recalibrate: calibrates the field on every frame
+    :param float noise: synthetic frames noise standard deviation
+    :return dict: the report
+    """
+    vision = detection.Detection()
+    vision.state = state.State()
+    vision.referee = GameReferee()
+    vision.tracking = tracking
+    vision.ball_windowing = ball_windowing
+    vision.timings = timings.Timings(frames)
+
+    if source is None:
+        renderer = render.Renderer(resolution)
+        vision.field.focal = renderer.focal
+        capture = None
+    else:
+        capture = sources.open_source(source, realtime=False)
+        resolution = None
+
+    markers_expected = 0
+    markers_found = 0
+    balls_expected = 0
+    balls_found = 0
+    position_errors = []
+    orientation_errors = []
+    ball_errors = []
+
+    processed = 0
+    duration = 0
+    for index in range(warmup + frames):
+        if index == warmup:
+            vision.timings.reset()
+
+        if capture is None:
+            objects = synthetic_scene(index)
+            image = renderer.render(objects, noise)
+            truth = render.ground_truth(objects)
+        else:
+            grabbed, image = capture.read()
+            if not grabbed:
+                break
+            truth = None
+            if resolution is None:
+                resolution = (image.shape[1], image.shape[0])
+                vision.field.focal = 885 * image.shape[0] / 1080
+
+        image_debug = image.copy()
+        frame_start = time.perf_counter()
+        if recalibrate:
+            vision.field.should_calibrate = True
+        # The detections are checked rather than the state, which keeps missed markers
+        markers = vision.find_markers(image, image_debug)
+        vision.state.set_markers(markers)
+        ball = vision.find_ball(image, image_debug)
+        vision.state.set_ball(ball)
+        with vision.timings.measure("annotations"):
+            vision.draw_annotations(image_debug)
+        frame_duration = time.perf_counter() - frame_start
+        vision.timings.add("total", frame_duration)
+
+        if index < warmup:
+            continue
+        processed += 1
+        duration += frame_duration
+
+        if truth is not None and vision.field.calibrated():
+            for name, expected in truth["markers"].items():
+                markers_expected += 1
+                if name in markers:
+                    markers_found += 1
+                    position_errors.append(
+                        np.linalg.norm(
+                            np.array(markers[name]["position"]) - expected["position"]
+                        )
+                    )
+                    orientation_errors.append(
+                        abs(
+                            utils.angle_wrap(
+                                markers[name]["orientation"] - expected["orientation"]
+                            )
+                        )
+                    )
+
+            if truth["ball"] is not None:
+                balls_expected += 1
+                if ball is not None:
+                    balls_found += 1
+                    ball_errors.append(np.linalg.norm(np.array(ball) - truth["ball"]))
+
+    if capture is not None:
+        capture.release()
+
+    return {
+        "source": source or "synthetic",
+        "resolution": None if resolution is None else list(resolution),
+        "options": {
+            "tracking": tracking,
+            "ball_windowing": ball_windowing,
+            "recalibrate": recalibrate,
+        },
+        "frames": processed,
+        # Frame rate of the vision alone (frames reading and rendering are not accounted)
+        "fps": processed / duration if duration > 0 else None,
+        "stages": vision.timings.stats(),
+        "calibrated": vision.field.calibrated(),
+        "markers_recall": (
+            markers_found / markers_expected if markers_expected else None
+        ),
+        "ball_recall": balls_found / balls_expected if balls_expected else None,
+        "position_error": percentiles(position_errors),
+        "orientation_error": percentiles(orientation_errors),
+        "ball_error": percentiles(ball_errors),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--source",
+        "-s",
+        type=str,
+        default=None,
+        help="Recorded frames (see sources.open_source), synthetic frames by default",
+    )
+    parser.add_argument(
+        "--resolution",
+        "-r",
+        type=str,
+        nargs="+",
+        default=["1920x1080"],
+        help="Synthetic frames resolutions (WxH)",
+    )
+    parser.add_argument("--frames", "-n", type=int, default=300)
+    parser.add_argument("--warmup", "-w", type=int, default=10)
+    parser.add_argument("--tracking", action="store_true")
+    parser.add_argument("--ball-windowing", action="store_true")
+    parser.add_argument("--recalibrate", action="store_true")
+    parser.add_argument("--noise", type=float, default=2)
+    parser.add_argument(
+        "--output", "-o", type=str, default=None, help="JSON output file"
+    )
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(x) for x in r.split("x")) for r in args.resolution]
+    if args.source is not None:
+        resolutions = [None]
+
+    reports = []
+    for resolution in resolutions:
+        reports.append(
+            run(
+                args.source,
+                resolution,
+                args.frames,
+                args.warmup,
+                args.tracking,
+                args.ball_windowing,
+                args.recalibrate,
+                args.noise,
+            )
+        )
+
+    output = json.dumps(reports, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
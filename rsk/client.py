@@ -70,6 +70,16 @@ class ClientTracked:
         self.pose = None
         self.orientation = None
         self.last_update = None
+        # Sequence number of the frame the position comes from, and its capture time
+        # (estimated in the local time.time() clock)
+        self.seq = None
+        self.capture_time = None
+        # Velocity (x, y) [m/s] and angular velocity [rad/s], estimated by the vision
+        self.velocity = None
+        self.angular_velocity = None
+        # Duration since the vision last saw the object (it is kept for a short time when
+        # it is missed) [s]
+        self.detection_age = None
 
 
 class ClientRobot(ClientTracked):
@@ -272,6 +282,13 @@ class Client:
         self.objs = {n: ClientTracked() for n in range(1, 9)}
 
         self.ball = None
+        # Ball velocity (x, y) [m/s], estimated by the vision
+        self.ball_velocity = None
+        # Sequence number and capture time (local time.time() clock) of the latest frame,
+        # and the delay between its capture and its reception [s]
+        self.frame_seq = None
+        self.frame_capture_time = None
+        self.latency = None
         # ZMQ Context
         self.context = zmq.Context()
 
@@ -328,7 +345,17 @@ class Client:
         """
         self.stop()
 
-    def update_position(self, tracked, infos):
+    def capture_time(self, json, timestamp, received):
+        """
+        Converts a (monotonic) capture timestamp of the vision to the local time.time() clock,
+        using the publication time of the message. The network delay is not accounted for.
+        """
+        if timestamp is None or "time" not in json:
+            return received
+
+        return received - (json["time"] - timestamp)
+
+    def update_position(self, tracked, infos, json=None, received=None):
         """
         Updates the position of the given tracked object.
         """
@@ -336,6 +363,15 @@ class Client:
         tracked.orientation = infos["orientation"]
         tracked.pose = np.array(list(tracked.position) + [tracked.orientation])
         tracked.last_update = time.time()
+        tracked.detection_age = infos.get("age")
+        if "velocity" in infos:
+            tracked.velocity = np.array(infos["velocity"])
+            tracked.angular_velocity = infos["angular_velocity"]
+        if json is not None:
+            tracked.seq = infos.get("seq")
+            tracked.capture_time = self.capture_time(
+                json, infos.get("timestamp"), received
+            )
 
     def sub_process(self):
         """
@@ -350,8 +386,19 @@ class Client:
                 dt = ts - last_t
                 last_t = ts
 
+                if "frame" in json:
+                    self.frame_seq = json["frame"]["seq"]
+                    self.frame_capture_time = self.capture_time(
+                        json, json["frame"]["timestamp"], ts
+                    )
+                    self.latency = ts - self.frame_capture_time
+
                 if "ball" in json:
                     self.ball = None if json["ball"] is None else np.array(json["ball"])
+                    velocity = json.get("ball_velocity")
+                    self.ball_velocity = (
+                        None if velocity is None else np.array(velocity)
+                    )
 
                 if "markers" in json:
                     for entry in json["markers"]:
@@ -360,11 +407,14 @@ class Client:
 
                         if team == "obj":
                             self.update_position(
-                                self.objs[number], json["markers"][entry]
+                                self.objs[number], json["markers"][entry], json, ts
                             )
                         else:
                             self.update_position(
-                                self.robots[team][number], json["markers"][entry]
+                                self.robots[team][number],
+                                json["markers"][entry],
+                                json,
+                                ts,
                             )
 
                 if "referee" in json:
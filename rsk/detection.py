@@ -3,7 +3,7 @@ import cv2
 import zmq
 import time
 from .field import Field
-from . import constants, config
+from . import constants, config, timings
 import os
 
 os.environ["OPENCV_VIDEOIO_MSMF_ENABLE_HW_TRANSFORMS"] = "0"
@@ -45,6 +45,9 @@ class Detection:
         # Goals Colors
         self.team_colors = {"green": (0, 255, 0), "blue": (255, 0, 0)}
 
+        # Cached overlay for static annotations (key, pixel indexes and colors)
+        self.overlay = None
+
         self.canceled_goal_side = None
 
         self.displaySettings = {
@@ -92,6 +95,31 @@ class Detection:
         self.lower_orange = np.array([0, 150, 150])
         self.upper_orange = np.array([25, 255, 255])
 
+        # Markers tracking: when enabled, markers are searched only in windows around their
+        # predicted positions, with a full frame scan every tracking_rescan frames
+        self.tracking: bool = False
+        self.tracking_rescan: int = 15
+        self.tracking_margin: float = 0.05  # [m]
+        self.tracked: dict = {}
+        self.tracked_poses: dict = {}
+        self.tracking_lost: bool = False
+        self.frames_since_scan: int = 0
+
+        # Ball windowing: when enabled, the ball is searched only in a window around its predicted
+        # position, the window size depends on the ball speed
+        self.ball_windowing: bool = False
+        self.ball_window_margin: float = 0.1  # [m]
+        self.ball_window_misses: int = 3
+        self.ball_window = None
+        self.ball_search_window = None
+        self.ball_position = None
+        self.ball_velocity = np.zeros(2)
+        self.ball_timestamp = None
+        self.ball_period = 0
+
+        # Stages durations
+        self.timings: timings.Timings = timings.Timings()
+
         # Detection output
         self.markers = {}
         self.last_updates = {}
@@ -144,20 +172,29 @@ class Detection:
         self.field.should_calibrate = True
         self.field.is_calibrated = False
 
+    def reset_tracking(self):
+        """
+        Resets the markers and ball tracking, for instance when the frame size changes
+        """
+        self.tracked = {}
+        self.tracked_poses = {}
+        self.ball_window = None
+
     def draw_point2square(
         self, image, center: list, margin: int, color: tuple, thickness: int
     ):
         """
         Helper to draw a square on the image
         """
-        pointA = self.field.position_to_pixel([center[0] - margin, center[1] + margin])
-        pointB = self.field.position_to_pixel([center[0] + margin, center[1] + margin])
-        pointC = self.field.position_to_pixel([center[0] + margin, center[1] - margin])
-        pointD = self.field.position_to_pixel([center[0] - margin, center[1] - margin])
-        cv2.line(image, pointA, pointB, color, thickness)
-        cv2.line(image, pointB, pointC, color, thickness)
-        cv2.line(image, pointC, pointD, color, thickness)
-        cv2.line(image, pointD, pointA, color, thickness)
+        pixels = self.field.positions_to_pixels(
+            [
+                [center[0] - margin, center[1] + margin],
+                [center[0] + margin, center[1] + margin],
+                [center[0] + margin, center[1] - margin],
+                [center[0] - margin, center[1] - margin],
+            ]
+        )
+        cv2.polylines(image, [pixels.astype(np.int32)], True, color, thickness)
 
     def draw_circle(
         self,
@@ -172,127 +209,154 @@ class Detection:
         """
         Helper to draw a circle on the image
         """
-        first_point = None
-        last_point = None
-        k = 0
-        for alpha in np.linspace(0, 2 * np.pi, points):
-            new_point = [
-                center[0] + np.cos(alpha) * radius,
-                center[1] + np.sin(alpha) * radius,
-                0,
-            ]
-            if last_point:
-                A = self.field.position_to_pixel(last_point)
-                B = self.field.position_to_pixel(new_point)
-                k += 1
-                if not dashed or k % 2 == 0:
-                    cv2.line(image, A, B, color, thickness)
-            last_point = new_point
-            if first_point is None:
-                first_point = new_point
+        alphas = np.linspace(0, 2 * np.pi, points)
+        pixels = self.field.positions_to_pixels(
+            np.column_stack(
+                (
+                    center[0] + np.cos(alphas) * radius,
+                    center[1] + np.sin(alphas) * radius,
+                )
+            )
+        ).astype(np.int32)
 
-    def draw_annotations(self, image_debug):
+        if dashed:
+            for k in range(2, points, 2):
+                cv2.line(image, pixels[k - 1], pixels[k], color, thickness)
+        else:
+            cv2.polylines(image, [pixels], False, color, thickness)
+
+    def draw_overlay(self, image_debug):
         """
-        Draw extra annotations (lines, circles etc.) to check visually that the informations are matching
-        the real images
+        Draws the static annotations (that only depend on the calibration, team sides and display
+        settings). They are rendered once in a cached overlay that is then applied on each image.
         """
-        if (
-            self.field.calibrated()
-            and (image_debug is not None)
-            and (self.referee is not None)
-        ):
-            if self.should_display("sideline"):
-                [
-                    field_UpRight,
-                    field_DownRight,
-                    field_DownLeft,
-                    field_UpLeft,
-                ] = constants.field_corners(constants.field_in_margin)
-                A = self.field.position_to_pixel(field_UpRight)
-                B = self.field.position_to_pixel(field_DownRight)
-                C = self.field.position_to_pixel(field_DownLeft)
-                D = self.field.position_to_pixel(field_UpLeft)
-                cv2.line(image_debug, A, B, (0, 255, 0), 1)
-                cv2.line(image_debug, B, C, (0, 255, 0), 1)
-                cv2.line(image_debug, C, D, (0, 255, 0), 1)
-                cv2.line(image_debug, D, A, (0, 255, 0), 1)
+        key = (
+            self.field.calibrations,
+            image_debug.shape,
+            self.referee.negative_team,
+            self.referee.positive_team,
+            self.should_display("sideline"),
+            self.should_display("goals"),
+            self.should_display("landmark"),
+        )
+
+        if self.overlay is None or self.overlay[0] != key:
+            overlay = np.zeros_like(image_debug)
+            self.draw_static_annotations(overlay)
+            indexes = np.flatnonzero(np.any(overlay, axis=2))
+            self.overlay = (key, indexes, overlay.reshape(-1, 3)[indexes])
+
+        key, indexes, colors = self.overlay
+        image_debug.reshape(-1, 3)[indexes] = colors
+
+    def draw_static_annotations(self, image_debug):
+        """
+        Draw the static annotations: sidelines, goals and center landmark
+        """
+        if self.should_display("sideline"):
+            [
+                field_UpRight,
+                field_DownRight,
+                field_DownLeft,
+                field_UpLeft,
+            ] = constants.field_corners(constants.field_in_margin)
+            A = self.field.position_to_pixel(field_UpRight)
+            B = self.field.position_to_pixel(field_DownRight)
+            C = self.field.position_to_pixel(field_DownLeft)
+            D = self.field.position_to_pixel(field_UpLeft)
+            cv2.line(image_debug, A, B, (0, 255, 0), 1)
+            cv2.line(image_debug, B, C, (0, 255, 0), 1)
+            cv2.line(image_debug, C, D, (0, 255, 0), 1)
+            cv2.line(image_debug, D, A, (0, 255, 0), 1)
+
+            [
+                field_UpRight,
+                field_DownRight,
+                field_DownLeft,
+                field_UpLeft,
+            ] = constants.field_corners(constants.field_out_margin)
+            A = self.field.position_to_pixel(field_UpRight)
+            B = self.field.position_to_pixel(field_DownRight)
+            C = self.field.position_to_pixel(field_DownLeft)
+            D = self.field.position_to_pixel(field_UpLeft)
+            cv2.line(image_debug, A, B, (0, 0, 255), 1)
+            cv2.line(image_debug, B, C, (0, 0, 255), 1)
+            cv2.line(image_debug, C, D, (0, 0, 255), 1)
+            cv2.line(image_debug, D, A, (0, 0, 255), 1)
+
+        if self.should_display("goals"):
+            for sign, color in [
+                (-1, self.team_colors[self.referee.negative_team]),
+                (1, self.team_colors[self.referee.positive_team]),
+            ]:
+                C = self.field.position_to_pixel(
+                    [
+                        sign * (constants.field_length / 2.0),
+                        -sign * constants.goal_width / 2.0,
+                    ]
+                )
+                D = self.field.position_to_pixel(
+                    [
+                        sign * (constants.field_length / 2.0),
+                        sign * constants.goal_width / 2.0,
+                    ]
+                )
+                E = self.field.position_to_pixel(
+                    [
+                        sign * (constants.field_length / 2.0),
+                        -sign * constants.goal_width / 2.0,
+                        constants.goal_virtual_height,
+                    ]
+                )
+                F = self.field.position_to_pixel(
+                    [
+                        sign * (constants.field_length / 2.0),
+                        sign * constants.goal_width / 2.0,
+                        constants.goal_virtual_height,
+                    ]
+                )
+                cv2.line(image_debug, C, D, color, 3)
+                cv2.line(image_debug, E, F, color, 2)
+                cv2.line(image_debug, C, E, color, 2)
+                cv2.line(image_debug, D, F, color, 2)
 
-                [
-                    field_UpRight,
-                    field_DownRight,
-                    field_DownLeft,
-                    field_UpLeft,
-                ] = constants.field_corners(constants.field_out_margin)
-                A = self.field.position_to_pixel(field_UpRight)
-                B = self.field.position_to_pixel(field_DownRight)
-                C = self.field.position_to_pixel(field_DownLeft)
-                D = self.field.position_to_pixel(field_UpLeft)
-                cv2.line(image_debug, A, B, (0, 0, 255), 1)
-                cv2.line(image_debug, B, C, (0, 0, 255), 1)
-                cv2.line(image_debug, C, D, (0, 0, 255), 1)
-                cv2.line(image_debug, D, A, (0, 0, 255), 1)
-
-            if self.should_display("goals"):
-                for sign, color in [
-                    (-1, self.team_colors[self.referee.negative_team]),
-                    (1, self.team_colors[self.referee.positive_team]),
-                ]:
-                    C = self.field.position_to_pixel(
-                        [
-                            sign * (constants.field_length / 2.0),
-                            -sign * constants.goal_width / 2.0,
-                        ]
-                    )
-                    D = self.field.position_to_pixel(
-                        [
-                            sign * (constants.field_length / 2.0),
-                            sign * constants.goal_width / 2.0,
-                        ]
-                    )
-                    E = self.field.position_to_pixel(
+                for post in [-1, 1]:
+                    A = self.field.position_to_pixel(
                         [
-                            sign * (constants.field_length / 2.0),
-                            -sign * constants.goal_width / 2.0,
-                            constants.goal_virtual_height,
+                            sign * (0.05 + constants.field_length / 2.0),
+                            post * constants.goal_width / 2.0,
                         ]
                     )
-                    F = self.field.position_to_pixel(
+                    B = self.field.position_to_pixel(
                         [
                             sign * (constants.field_length / 2.0),
-                            sign * constants.goal_width / 2.0,
-                            constants.goal_virtual_height,
+                            post * constants.goal_width / 2.0,
                         ]
                     )
-                    cv2.line(image_debug, C, D, color, 3)
-                    cv2.line(image_debug, E, F, color, 2)
-                    cv2.line(image_debug, C, E, color, 2)
-                    cv2.line(image_debug, D, F, color, 2)
-
-                    for post in [-1, 1]:
-                        A = self.field.position_to_pixel(
-                            [
-                                sign * (0.05 + constants.field_length / 2.0),
-                                post * constants.goal_width / 2.0,
-                            ]
-                        )
-                        B = self.field.position_to_pixel(
-                            [
-                                sign * (constants.field_length / 2.0),
-                                post * constants.goal_width / 2.0,
-                            ]
-                        )
-                        cv2.line(image_debug, A, B, color, 3)
-
-            if self.should_display("landmark"):
-                A = self.field.position_to_pixel([0, 0])
-                B = self.field.position_to_pixel([0.2, 0])
-                cv2.line(image_debug, A, B, (0, 0, 255), 1)
-                A = self.field.position_to_pixel([0, 0])
-                B = self.field.position_to_pixel([0, 0.2])
-                cv2.line(image_debug, A, B, (0, 255, 0), 1)
-                A = self.field.position_to_pixel([0, 0, 0])
-                B = self.field.position_to_pixel([0, 0, 0.2])
-                cv2.line(image_debug, A, B, (255, 0, 0), 1)
+                    cv2.line(image_debug, A, B, color, 3)
+
+        if self.should_display("landmark"):
+            A = self.field.position_to_pixel([0, 0])
+            B = self.field.position_to_pixel([0.2, 0])
+            cv2.line(image_debug, A, B, (0, 0, 255), 1)
+            A = self.field.position_to_pixel([0, 0])
+            B = self.field.position_to_pixel([0, 0.2])
+            cv2.line(image_debug, A, B, (0, 255, 0), 1)
+            A = self.field.position_to_pixel([0, 0, 0])
+            B = self.field.position_to_pixel([0, 0, 0.2])
+            cv2.line(image_debug, A, B, (255, 0, 0), 1)
+
+    def draw_annotations(self, image_debug):
+        """
+        Draw extra annotations (lines, circles etc.) to check visually that the informations are matching
+        the real images
+        """
+        if (
+            self.field.calibrated()
+            and (image_debug is not None)
+            and (self.referee is not None)
+        ):
+            self.draw_overlay(image_debug)
 
             if self.should_display("timed_circle") and self.ball is not None:
                 self.draw_circle(
@@ -334,7 +398,15 @@ class Detection:
 
     def detect_markers(self, image, image_debug=None):
         """
-        Detect the fiducial markers on the image, they are passed to the field for calibration
+        Detect the fiducial markers on the image and update the state
+        """
+        self.state.set_markers(self.find_markers(image, image_debug))
+
+    def aruco(self, image) -> tuple:
+        """
+        Runs the ArUco detector on an image
+
+        :return tuple: detected corners and ids
         """
         if self.is_new_aruco_api():
             (corners, ids, rejected) = self.detector.detectMarkers(image)
@@ -343,7 +415,114 @@ class Detection:
                 image, self.arucoDict, parameters=self.arucoParams
             )
 
+        return corners, ids
+
+    def tracking_window(self, item: str, image):
+        """
+        Predicts the window of the image where a tracked marker should be seen
+
+        :param str item: the marker name
+        :return tuple|None: the window (x_min, y_min, x_max, y_max), None if it can't be predicted
+        """
+        if item[0] == "c":
+            # Corners are fixed on the ground
+            center = np.mean(self.field.corner_field_positions[item], axis=0)
+            radius = constants.corner_tag_size / np.sqrt(2)
+            z = 0.0
+        elif item in self.tracked_poses:
+            center = self.tracked_poses[item]["position"]
+            radius = constants.robot_tag_size / np.sqrt(2)
+            z = constants.robot_height
+        else:
+            return None
+
+        radius += self.tracking_margin
+        pixels = self.field.positions_to_pixels(
+            [
+                [center[0] + sx * radius, center[1] + sy * radius, z]
+                for sx, sy in [(-1, -1), (-1, 1), (1, 1), (1, -1)]
+            ]
+        )
+
+        height, width = image.shape[:2]
+        x_min, y_min = np.maximum(pixels.min(axis=0), 0)
+        x_max, y_max = np.minimum(pixels.max(axis=0), [width, height])
+        if x_max <= x_min or y_max <= y_min:
+            return None
+
+        return x_min, y_min, x_max, y_max
+
+    def should_scan_full_frame(self) -> bool:
+        """
+        Checks if the markers should be searched on the full frame, instead of tracked windows
+
+        :return bool: True if a full frame scan is needed
+        """
+        return (
+            not self.tracking
+            or not self.field.calibrated()
+            or len(self.tracked) == 0
+            or self.tracking_lost
+            or self.frames_since_scan >= self.tracking_rescan
+            or any(
+                item[0] != "c" and item not in self.tracked_poses
+                for item in self.tracked.values()
+            )
+        )
+
+    def detect_aruco(self, image, image_debug=None) -> tuple:
+        """
+        Detects ArUco markers, either on the full frame or only around the tracked markers
+
+        :return tuple: detected corners and ids
+        """
+        if self.should_scan_full_frame():
+            self.frames_since_scan = 0
+            return self.aruco(image)
+
+        self.frames_since_scan += 1
+        all_corners, all_ids = [], []
+        for item in self.tracked.values():
+            window = self.tracking_window(item, image)
+            if window is None:
+                continue
+
+            x_min, y_min, x_max, y_max = window
+            corners, ids = self.aruco(image[y_min:y_max, x_min:x_max])
+            if ids is not None:
+                for markerCorner, markerID in zip(corners, ids.flatten()):
+                    # Windows can overlap, a marker is kept only once
+                    if markerID not in all_ids:
+                        all_corners.append(markerCorner + [x_min, y_min])
+                        all_ids.append(markerID)
+
+            if image_debug is not None and self.should_display("aruco"):
+                cv2.rectangle(
+                    image_debug,
+                    (int(x_min), int(y_min)),
+                    (int(x_max), int(y_max)),
+                    (128, 128, 128),
+                    1,
+                )
+
+        if len(all_ids) == 0:
+            return all_corners, None
+
+        return all_corners, np.array(all_ids).reshape(-1, 1)
+
+    def find_markers(self, image, image_debug=None) -> dict:
+        """
+        Detect the fiducial markers on the image, they are passed to the field for calibration
+
+        :return dict: the detected markers poses
+        """
+        t0 = time.perf_counter()
+        self.field.set_image_size((image.shape[1], image.shape[0]))
+        (corners, ids) = self.detect_aruco(image, image_debug)
+
         new_markers = {}
+        found = {}
+        tags = []
 
         if len(corners) > 0:
             for markerCorner, markerID in zip(corners, ids.flatten()):
@@ -354,6 +533,7 @@ class Detection:
 
                 # Draw the bounding box of the ArUCo detection
                 item = self.arucoItems[markerID][0]
+                found[markerID] = item
 
                 if item[0] == "c":
                     self.field.set_corner_position(item, corners)
@@ -409,20 +589,73 @@ class Detection:
                         )
 
                 if self.field.calibrated() and item[0] != "c":
-                    new_markers[item] = self.field.pose_of_tag(corners)
+                    tags.append((item, corners))
                     self.last_updates[item] = time.time()
 
-        self.field.update_calibration(image)
-        self.state.set_markers(new_markers)
+        # Computing all the tags poses at once
+        if len(tags):
+            positions, orientations = self.field.poses_of_tags(
+                [corners for item, corners in tags]
+            )
+            for (item, corners), position, orientation in zip(
+                tags, positions, orientations
+            ):
+                new_markers[item] = {
+                    "position": position.tolist(),
+                    "orientation": float(orientation),
+                }
+
+        self.timings.add("markers", time.perf_counter() - t0)
+
+        with self.timings.measure("calibration"):
+            self.field.update_calibration(image)
+
+        # If a tracked marker was not found in its window, the next frame will be fully scanned
+        self.tracking_lost = any(markerID not in found for markerID in self.tracked)
+        self.tracked = found
+        self.tracked_poses = new_markers
+
+        return new_markers
 
     def detect_ball(self, image, image_debug):
+        """
+        Detects the ball in the image and update the state
+        """
+        self.state.set_ball(self.find_ball(image, image_debug))
+
+    def find_ball(self, image, image_debug):
         """
         Detects the ball in the image
+
+        :return list|None: the ball position
         """
+        return self.select_ball(self.ball_candidates(image), image_debug)
 
-        # Converts the image to HSV and apply a threshold
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, self.lower_orange, self.upper_orange)
+    def ball_candidates(self, image) -> list:
+        """
+        Finds the ball candidates (orange blobs) in the image. This only works on pixels and does
+        not use the field calibration, so that it can run concurrently with markers detection.
+
+        :return list: candidates positions in the image
+        """
+        t0 = time.perf_counter()
+
+        # Restricting the search to the predicted window
+        x_offset, y_offset = 0, 0
+        window = self.ball_window if self.ball_windowing else None
+        if window is not None:
+            height, width = image.shape[:2]
+            x_min, y_min = max(window[0], 0), max(window[1], 0)
+            x_max, y_max = min(window[2], width), min(window[3], height)
+            if x_max > x_min and y_max > y_min:
+                image = image[y_min:y_max, x_min:x_max]
+                x_offset, y_offset = x_min, y_min
+                window = [x_min, y_min, x_max, y_max]
+            else:
+                window = None
+        self.ball_search_window = window
+
+        mask = self.ball_mask(image)
 
         # Detect connected components
         output = cv2.connectedComponentsWithStats(mask, 8, cv2.CV_32S)
@@ -434,32 +667,60 @@ class Detection:
         candidates = []
         for k in range(1, num_labels):
             if stats[k][4] > 3:
-                candidates.append(list(centroids[k]))
+                candidates.append(
+                    [centroids[k][0] + x_offset, centroids[k][1] + y_offset]
+                )
                 if len(candidates) > 16:
                     break
 
+        self.timings.add("ball", time.perf_counter() - t0)
+
+        return candidates
+
+    def ball_mask(self, image):
+        """
+        Computes the mask of orange pixels
+
+        :param image: the (BGR) image
+        :return: the mask (255 for orange pixels)
+        """
+        # Converts the image to HSV and apply a threshold
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        return cv2.inRange(hsv, self.lower_orange, self.upper_orange)
+
+    def select_ball(self, candidates: list, image_debug):
+        """
+        Selects the best ball candidate
+
+        :param list candidates: candidates positions in the image
+        :return list|None: the ball position, None if the ball is not seen in this frame
+        """
+        t0 = time.perf_counter()
+
         # For each candidate, we will then check which one is the best (closest to previous estimation)
         if len(candidates):
-            best = None
-            bestPx = None
-            bestDist = None
             self.no_ball = 0
 
-            for point in candidates:
-                if self.field.calibrated():
-                    pos = self.field.pixel_to_position(point, constants.ball_height)
-                else:
-                    pos = point
-
-                if self.ball:
-                    dist = np.linalg.norm(np.array(pos) - np.array(self.ball))
-                else:
-                    dist = 0
-
-                if best is None or dist < bestDist:
-                    bestDist = dist
-                    best = pos
-                    bestPx = point
+            if self.field.calibrated():
+                positions = self.field.pixels_to_positions(
+                    candidates, constants.ball_height
+                )
+            else:
+                positions = np.array(candidates)
+
+            # The candidate closest to the ball predicted position (or to its last position)
+            # is selected
+            reference, _ = self.state.get_ball()
+            if reference is None:
+                reference = self.ball
+            if reference:
+                dists = np.linalg.norm(positions - np.array(reference), axis=1)
+                index = int(np.argmin(dists))
+            else:
+                index = 0
+
+            best = positions[index].tolist()
+            bestPx = candidates[index]
 
             if self.should_display("ball"):
                 if image_debug is not None and best:
@@ -478,13 +739,78 @@ class Detection:
             if self.no_ball > 10:
                 self.ball = None
 
-        self.state.set_ball(self.ball)
+        if self.ball_windowing:
+            if image_debug is not None and self.should_display("ball"):
+                if self.ball_search_window is not None:
+                    x_min, y_min, x_max, y_max = self.ball_search_window
+                    cv2.rectangle(
+                        image_debug, (x_min, y_min), (x_max, y_max), (255, 255, 0), 1
+                    )
+            self.update_ball_window()
+
+        self.timings.add("ball_select", time.perf_counter() - t0)
+
+        # The last position is kept for the annotations and the ball window, while the
+        # published position is extrapolated by the state filter when the ball is missed
+        return self.ball if self.no_ball == 0 else None
+
+    def update_ball_window(self):
+        """
+        Predicts the window (in pixels) where the ball should be searched in the next frame
+        """
+        timestamp = time.monotonic()
+        self.ball_window = None
+
+        if (
+            not self.field.calibrated()
+            or self.ball is None
+            or self.no_ball >= self.ball_window_misses
+        ):
+            self.ball_timestamp = None
+            self.ball_velocity = np.zeros(2)
+            return
+
+        position = np.array(self.ball)
+        if self.no_ball == 0:
+            if self.ball_timestamp is not None:
+                dt = timestamp - self.ball_timestamp
+                if dt > 0:
+                    self.ball_velocity = (position - self.ball_position) / dt
+            self.ball_position = position
+            self.ball_period = (
+                0 if self.ball_timestamp is None else timestamp - self.ball_timestamp
+            )
+            self.ball_timestamp = timestamp
+
+        # The window is centered on the predicted position, and grows with the ball speed and
+        # the number of frames where the ball was not seen
+        frames = 1 + self.no_ball
+        center = position + self.ball_velocity * self.ball_period * frames
+        radius = (
+            self.ball_window_margin
+            + np.linalg.norm(self.ball_velocity) * self.ball_period
+        ) * frames
+
+        pixels = self.field.positions_to_pixels(
+            [
+                [
+                    center[0] + sx * radius,
+                    center[1] + sy * radius,
+                    constants.ball_height,
+                ]
+                for sx, sy in [(-1, -1), (-1, 1), (1, 1), (1, -1)]
+            ]
+        )
+        self.ball_window = [
+            int(value) for value in [*pixels.min(axis=0), *pixels.max(axis=0)]
+        ]
 
     def get_detection(self, foo=None):
         while True:
             try:
                 return {
                     "ball": self.ball,
+                    "ball_window": self.ball_search_window,
                     "markers": self.markers,
                     "calibrated": self.field.calibrated(),
                     "see_whole_field": self.field.see_whole_field,
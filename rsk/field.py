@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 import logging
+import threading
 from . import constants
 import os
 
@@ -15,9 +16,14 @@ class Field:
     def __init__(self):
         self.logger: logging.Logger = logging.getLogger("field")
         self.focal = None
+        # Size of the processed images (width, height), if known
+        self.image_size: tuple = None
 
         # Should we (re-)calibrate the field ?
         self.should_calibrate: bool = True
+        # Minimum number of corners to calibrate (cameras seeing only a part of the field
+        # can use less than 4 corners)
+        self.min_corners: int = 4
 
         self.corner_field_positions = {}
         for c, sx, sy in (["c1", 1, 1], ["c2", 1, -1], ["c3", -1, 1], ["c4", -1, -1]):
@@ -58,8 +64,9 @@ class Field:
         # Position of corners on the image
         self.corner_gfx_positions: dict = {}
 
-        # Is the field calibrated ?
+        # Is the field calibrated ? (and number of calibrations done)
         self.is_calibrated = False
+        self.calibrations: int = 0
 
         # Do we see the whole field ?
         self.see_whole_field = False
@@ -73,6 +80,61 @@ class Field:
         self.distortion = None
         self.errors = 0
 
+        # Homographies (and their inverses) between the image and planes of fixed heights, they are
+        # used instead of the full projection when possible
+        self.use_homographies: bool = True
+        self.homographies: dict = {}
+
+        # Calibration updates are serialized with projections, since they can run in different
+        # threads (for instance markers detection and ball selection in the pipeline)
+        self.lock = threading.RLock()
+
+    def set_focal(self, focal: float):
+        """
+        Sets the camera focal, the calibration is adapted to it (see update_intrinsic)
+
+        :param float focal: the focal [px]
+        """
+        if focal != self.focal:
+            self.focal = focal
+            self.update_intrinsic()
+
+    def set_image_size(self, size: tuple):
+        """
+        Sets the size of the processed images, the calibration is adapted to it (see
+        update_intrinsic)
+
+        :param tuple size: the image size (width, height)
+        """
+        if size != self.image_size:
+            self.image_size = size
+            self.update_intrinsic()
+
+    def update_intrinsic(self):
+        """
+        Adapts the current calibration to a new focal or image size. The principal point being
+        the image center, the extrinsic parameters are unchanged when the image is rescaled or
+        center cropped. A new calibration is requested anyway.
+        """
+        with self.lock:
+            if (
+                self.is_calibrated
+                and self.focal is not None
+                and self.image_size is not None
+            ):
+                width, height = self.image_size
+                self.intrinsic = np.array(
+                    [
+                        [self.focal, 0, width / 2],
+                        [0, self.focal, height / 2],
+                        [0, 0, 1],
+                    ],
+                    dtype=np.float64,
+                )
+                self.update_homographies()
+                self.calibrations += 1
+                self.should_calibrate = True
+
     def calibrated(self) -> bool:
         """
         Is the field calibrated ?
@@ -116,7 +178,7 @@ class Field:
         :param image: the (OpenCV) image used for calibration
         """
         if (
-            len(self.corner_gfx_positions) >= 4
+            len(self.corner_gfx_positions) >= self.min_corners
             and self.should_calibrate
             and self.focal is not None
         ):
@@ -157,7 +219,7 @@ class Field:
                 + cv2.CALIB_FIX_K5
             )
 
-            ret, self.intrinsic, self.distortion, rvecs, tvecs = cv2.calibrateCamera(
+            ret, intrinsic, distortion, rvecs, tvecs = cv2.calibrateCamera(
                 [object_points],
                 [graphics_positions],
                 image.shape[:2][::-1],
@@ -171,48 +233,50 @@ class Field:
             transformation[:3, :3], _ = cv2.Rodrigues(rvecs[0])
             transformation[:3, 3] = tvecs[0].T
             # transformation[:3, 3] = [0, 0, 2]
-            self.extrinsic = transformation
-            self.extrinsic_inv = np.linalg.inv(self.extrinsic)
-
-            # We are now calibrated
-            self.is_calibrated = True
+            with self.lock:
+                self.intrinsic, self.distortion = intrinsic, distortion
+                self.extrinsic = transformation
+                self.extrinsic_inv = np.linalg.inv(self.extrinsic)
+                self.update_homographies()
+
+                # We are now calibrated
+                self.image_size = (image.shape[1], image.shape[0])
+                self.is_calibrated = True
+            self.calibrations += 1
             self.should_calibrate = False
             self.errors = 0
 
             # Checking if we can see the whole fields
             image_height, image_width, _ = image.shape
-            image_points = []
-            self.see_whole_field = True
-            for sx, sy in [(-1, 1), (1, 1), (1, -1), (-1, -1)]:
-                x = sx * ((constants.field_length / 2) + constants.border_size)
-                y = sy * ((constants.field_width / 2) + constants.border_size)
-
-                img = self.position_to_pixel([x, y, 0.0])
-                image_points.append((int(img[0]), int(img[1])))
-
-                if (
-                    img[0] < 0
-                    or img[0] > image_width
-                    or img[1] < 0
-                    or img[1] > image_height
-                ):
-                    self.see_whole_field = False
+            positions = [
+                [
+                    sx * ((constants.field_length / 2) + constants.border_size),
+                    sy * ((constants.field_width / 2) + constants.border_size),
+                    0.0,
+                ]
+                for sx, sy in [(-1, 1), (1, 1), (1, -1), (-1, -1)]
+            ]
+            image_points = self.positions_to_pixels(positions)
+            self.see_whole_field = bool(
+                np.all(image_points >= 0)
+                and np.all(image_points <= [image_width, image_height])
+            )
 
         # We check that calibration is consistent, this can happen be done with only a few corners
         # The goal is to avoid recalibrating everytime for performance reasons
-        if len(self.corner_gfx_positions) >= 3:
+        if len(self.corner_gfx_positions) >= min(3, self.min_corners):
             if self.is_calibrated:
-                has_error = False
+                graphics_positions = []
+                object_points = []
                 for key in self.corner_gfx_positions:
-                    for gfx, real in zip(
-                        self.corner_gfx_positions[key], self.corner_field_positions[key]
-                    ):
-                        projected_position = self.pixel_to_position(gfx)
-                        reprojection_distance = np.linalg.norm(
-                            np.array(real) - np.array(projected_position)
-                        )
-                        if reprojection_distance > 0.025:
-                            has_error = True
+                    graphics_positions += list(self.corner_gfx_positions[key])
+                    object_points += self.corner_field_positions[key]
+
+                projected_positions = self.pixels_to_positions(graphics_positions)
+                reprojection_distances = np.linalg.norm(
+                    np.array(object_points) - projected_positions, axis=1
+                )
+                has_error = bool(np.any(reprojection_distances > 0.025))
 
                 if not has_error:
                     self.errors = 0
@@ -224,6 +288,37 @@ class Field:
 
         self.corner_gfx_positions = {}
 
+    def update_homographies(self):
+        """
+        Computes the homographies between the image and the planes used for detection (ground, robots
+        and ball heights). This is only possible because the calibration assumes no distortion.
+        """
+        self.homographies = {}
+
+        if not np.any(self.distortion):
+            R = self.extrinsic[:3, :3]
+            t = self.extrinsic[:3, 3]
+            for z in [0.0, constants.robot_height, constants.ball_height]:
+                # A point (x, y, z) is projected as K (x R1 + y R2 + z R3 + t)
+                H = self.intrinsic @ np.column_stack(
+                    (R[:, 0], R[:, 1], z * R[:, 2] + t)
+                )
+                self.homographies[z] = (H, np.linalg.inv(H))
+
+    def homography(self, z: float):
+        """
+        Retrieve the homography for a given plane
+
+        :param float z: the plane height
+        :return tuple|None: the homography and its inverse, None if not available
+        """
+        if self.use_homographies:
+            for plane_z in self.homographies:
+                if abs(plane_z - z) < 1e-9:
+                    return self.homographies[plane_z]
+
+        return None
+
     def field_to_camera(self, point: list) -> np.ndarray:
         """
         Transforms a point from field frame to camera frame
@@ -250,19 +345,24 @@ class Field:
         :param float z: the height to intersect with, defaults to 0
         :return list: point coordinates (x, y)
         """
+        with self.lock:
+            homography = self.homography(z)
+            if homography is not None:
+                position = homography[1] @ np.array([pixel[0], pixel[1], 1.0])
+                return list(position[:2] / position[2])
 
-        # Computing the point position in camera frame
-        point_position_camera = cv2.undistortPoints(
-            np.array(pixel), self.intrinsic, self.distortion
-        )[0][0]
+            # Computing the point position in camera frame
+            point_position_camera = cv2.undistortPoints(
+                np.array(pixel), self.intrinsic, self.distortion
+            )[0][0]
 
-        # Computing the point position in the field frame and solving for given z
-        point_position_field = self.camera_to_field([*point_position_camera, 1.0])
-        camera_center_field = self.camera_to_field(np.array([0.0, 0.0, 0.0]))
-        delta = point_position_field - camera_center_field
-        _lambda = (z - camera_center_field[2]) / delta[2]
+            # Computing the point position in the field frame and solving for given z
+            point_position_field = self.camera_to_field([*point_position_camera, 1.0])
+            camera_center_field = self.camera_to_field(np.array([0.0, 0.0, 0.0]))
+            delta = point_position_field - camera_center_field
+            _lambda = (z - camera_center_field[2]) / delta[2]
 
-        return list(camera_center_field + _lambda * delta)[:2]
+            return list(camera_center_field + _lambda * delta)[:2]
 
     def position_to_pixel(self, pos: list) -> list:
         """
@@ -271,21 +371,27 @@ class Field:
         :param list pos: position in field frame (2D or 3D)
         :return list: position on the screen
         """
-        if len(pos) == 2:
-            # If no z is provided, assume it is a ground position
-            pos = [*pos, 0.0]
-
-        point_position_camera = self.field_to_camera(pos)
-        position, J = cv2.projectPoints(
-            point_position_camera,
-            np.zeros(3),
-            np.zeros(3),
-            self.intrinsic,
-            self.distortion,
-        )
-        position = position[0][0]
+        with self.lock:
+            if len(pos) == 2:
+                # If no z is provided, assume it is a ground position
+                pos = [*pos, 0.0]
+
+            homography = self.homography(pos[2])
+            if homography is not None:
+                position = homography[0] @ np.array([pos[0], pos[1], 1.0])
+                return [int(position[0] / position[2]), int(position[1] / position[2])]
+
+            point_position_camera = self.field_to_camera(pos)
+            position, J = cv2.projectPoints(
+                point_position_camera,
+                np.zeros(3),
+                np.zeros(3),
+                self.intrinsic,
+                self.distortion,
+            )
+            position = position[0][0]
 
-        return [int(position[0]), int(position[1])]
+            return [int(position[0]), int(position[1])]
 
     def pose_of_tag(self, corners: list):
         """
@@ -310,3 +416,91 @@ class Field:
             }
         else:
             return None
+
+    def pixels_to_positions(self, pixels, z: float = 0) -> np.ndarray:
+        """
+        Batch version of pixel_to_position, transforms pixels on the image to 3D points on the field,
+        given a z
+
+        :param pixels: pixels (N x 2)
+        :param float z: the height to intersect with, defaults to 0
+        :return np.ndarray: points coordinates (N x 2)
+        """
+        with self.lock:
+            pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 1, 2)
+            if len(pixels) == 0:
+                return np.zeros((0, 2))
+
+            homography = self.homography(z)
+            if homography is not None:
+                H_inv = homography[1]
+                positions = pixels[:, 0] @ H_inv[:, :2].T + H_inv[:, 2]
+                return positions[:, :2] / positions[:, 2:]
+
+            # Computing the points positions in camera frame (on the z=1 plane)
+            points_camera = cv2.undistortPoints(
+                pixels, self.intrinsic, self.distortion
+            ).reshape(-1, 2)
+
+            # Computing the rays in the field frame and solving for given z
+            camera_center_field = self.extrinsic_inv[:3, 3]
+            deltas = np.hstack((points_camera, np.ones((len(points_camera), 1))))
+            deltas = deltas @ self.extrinsic_inv[:3, :3].T
+            _lambdas = (z - camera_center_field[2]) / deltas[:, 2]
+
+            return (camera_center_field + _lambdas[:, None] * deltas)[:, :2]
+
+    def positions_to_pixels(self, positions) -> np.ndarray:
+        """
+        Batch version of position_to_pixel, finds the positions of points on the screen
+
+        :param positions: positions in field frame (N x 2, assumed on the ground, or N x 3)
+        :return np.ndarray: positions on the screen (N x 2, integers)
+        """
+        with self.lock:
+            positions = np.asarray(positions, dtype=np.float64)
+            if len(positions) == 0:
+                return np.zeros((0, 2), dtype=int)
+            if positions.shape[1] == 2:
+                # If no z is provided, assume it is a ground position
+                positions = np.hstack((positions, np.zeros((len(positions), 1))))
+
+            # If all the positions are on the same plane, using its homography
+            homography = self.homography(positions[0, 2])
+            if homography is not None and (positions[:, 2] == positions[0, 2]).all():
+                H = homography[0]
+                pixels = positions[:, :2] @ H[:, :2].T + H[:, 2]
+                return (pixels[:, :2] / pixels[:, 2:]).astype(int)
+
+            points_camera = positions @ self.extrinsic[:3, :3].T + self.extrinsic[:3, 3]
+            pixels, J = cv2.projectPoints(
+                points_camera,
+                np.zeros(3),
+                np.zeros(3),
+                self.intrinsic,
+                self.distortion,
+            )
+
+            return pixels.reshape(-1, 2).astype(int)
+
+    def poses_of_tags(self, corners) -> tuple:
+        """
+        Batch version of pose_of_tag, returns the positions and orientations of detected tags
+
+        :param corners: tags corners (N x 4 x 2)
+        :return tuple: positions (N x 2) and orientations (N), None if not calibrated
+        """
+        if not self.calibrated():
+            return None
+
+        corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+        centers = (corners[:, 0] + corners[:, 2]) / 2.0
+        fronts = (corners[:, 0] + corners[:, 1]) / 2.0
+
+        positions = self.pixels_to_positions(
+            np.vstack((centers, fronts)), constants.robot_height
+        )
+        centers, fronts = positions[: len(corners)], positions[len(corners) :]
+        deltas = fronts - centers
+
+        return centers, np.arctan2(deltas[:, 1], deltas[:, 0])
@@ -0,0 +1,253 @@
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Names of the rings created by this process
+owned_names: set = set()
+
+
+class FrameRing:
+    """
+    A ring of frames in shared memory, written by one producer and read by any number of
+    consumers (possibly in other processes).
+
+    Each slot has a sequence number that is set to -1 while the slot is being written, so
+    that readers can detect frames that were overwritten while they were copying them.
+
+    Readers can either copy the frames (read) or access them without copy (view), checking
+    afterwards that the frame was not overwritten meanwhile (valid).
+
+    Example of an external consumer::
+
+        ring = FrameRing("rsk_frames")
+        seq = -1
+        while not ring.closed:
+            entry = ring.view(seq)
+            if entry is not None:
+                seq, timestamp, image = entry
+                ...  # uses image
+                if not ring.valid(seq):
+                    ...  # the frame was overwritten while being used
+    """
+
+    # Header: latest sequence number, number of slots, frame height, width and channels, and
+    # whether the producer closed the ring
+    header_size = 8
+
+    def __init__(self, name: str, shape: tuple = None, slots: int = 4):
+        """
+        :param str name: the shared memory name
+        :param tuple shape: the frame shape, the shared memory is created if given, else
+            an existing one is attached
+        :param int slots: the number of slots (when creating)
+        """
+        self.name: str = name
+        self.owner: bool = shape is not None
+
+        if self.owner:
+            if len(shape) == 2:
+                shape = (*shape, 1)
+            size = self.layout(slots, shape)
+            try:
+                self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+            except FileExistsError:
+                # Left by a producer that did not exit properly
+                stale = self.attach(name)
+                stale.close()
+                stale.unlink()
+                self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+            owned_names.add(name)
+            self.header = np.ndarray(
+                (self.header_size,), np.int64, self.memory.buf, offset=0
+            )
+            self.header[:] = 0
+            self.header[1] = slots
+            self.header[2:5] = shape
+            self.header[0] = -1
+        else:
+            self.memory = self.attach(name)
+            self.header = np.ndarray(
+                (self.header_size,), np.int64, self.memory.buf, offset=0
+            )
+
+        self.slots: int = int(self.header[1])
+        self.shape: tuple = tuple(int(x) for x in self.header[2:5])
+        self.layout(self.slots, self.shape)
+
+        # Slot sequence numbers, capture timestamps and images
+        self.slot_seqs = np.ndarray(
+            (self.slots,), np.int64, self.memory.buf, offset=self.seqs_offset
+        )
+        self.slot_timestamps = np.ndarray(
+            (self.slots,), np.float64, self.memory.buf, offset=self.timestamps_offset
+        )
+        self.images = np.ndarray(
+            (self.slots, *self.shape),
+            np.uint8,
+            self.memory.buf,
+            offset=self.data_offset,
+        )
+        if self.owner:
+            self.slot_seqs[:] = -1
+
+    def attach(self, name: str) -> shared_memory.SharedMemory:
+        """
+        Attaches to an existing shared memory, without letting the resource tracker remove
+        it when this process exits (it belongs to the producer)
+
+        :param str name: the shared memory name
+        :return SharedMemory: the shared memory
+        """
+        try:
+            return shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python < 3.13
+            memory = shared_memory.SharedMemory(name)
+            if os.name != "nt" and name not in owned_names:
+                resource_tracker.unregister(memory._name, "shared_memory")
+            return memory
+
+    def layout(self, slots: int, shape: tuple) -> int:
+        """
+        Computes the offsets of the shared memory sections
+
+        :param int slots: the number of slots
+        :param tuple shape: the frame shape
+        :return int: the total size [bytes]
+        """
+        self.seqs_offset = self.header_size * 8
+        self.timestamps_offset = self.seqs_offset + slots * 8
+        self.data_offset = self.timestamps_offset + slots * 8
+
+        return self.data_offset + slots * int(np.prod(shape))
+
+    @property
+    def seq(self) -> int:
+        """
+        The sequence number of the latest written frame (-1 if none)
+        """
+        return int(self.header[0])
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the producer closed the ring (for instance because the frame shape changed),
+        readers should then attach again
+        """
+        return self.header is None or bool(self.header[5])
+
+    def write(self, image: np.ndarray, timestamp: float = None, seq: int = None) -> int:
+        """
+        Writes a frame in the next slot
+
+        :param np.ndarray image: the frame, its shape should match the ring one
+        :param float timestamp: the capture timestamp (monotonic), defaults to now
+        :param int seq: the frame sequence number, should be increasing (defaults to the
+            next one)
+        :return int: the frame sequence number
+        """
+        if seq is None or seq <= self.seq:
+            seq = self.seq + 1
+        slot = seq % self.slots
+
+        self.slot_seqs[slot] = -1
+        self.images[slot] = image.reshape(self.shape)
+        self.slot_timestamps[slot] = (
+            time.monotonic() if timestamp is None else timestamp
+        )
+        self.slot_seqs[slot] = seq
+        self.header[0] = seq
+
+        return seq
+
+    def read(self, last_seq: int = -1):
+        """
+        Reads (copies) the latest frame
+
+        :param int last_seq: the sequence number of the last frame read, None is returned
+            if there is no newer frame
+        :return: a (seq, timestamp, image) tuple, or None
+        """
+        seq = self.seq
+        if seq < 0 or seq <= last_seq:
+            return None
+
+        slot = seq % self.slots
+        timestamp = float(self.slot_timestamps[slot])
+        image = self.images[slot].copy()
+
+        if self.slot_seqs[slot] != seq:
+            # The slot was overwritten while it was copied
+            return None
+
+        if self.shape[2] == 1:
+            image = image[:, :, 0]
+
+        return seq, timestamp, image
+
+    def view(self, last_seq: int = -1):
+        """
+        Gets the latest frame, without copy. The image is only valid until its slot is written
+        again, which can be checked with valid.
+
+        :param int last_seq: the sequence number of the last frame read, None is returned
+            if there is no newer frame
+        :return: a (seq, timestamp, image) tuple, or None
+        """
+        seq = self.seq
+        if seq < 0 or seq <= last_seq:
+            return None
+
+        slot = seq % self.slots
+        timestamp = float(self.slot_timestamps[slot])
+        image = self.images[slot]
+        if self.shape[2] == 1:
+            image = image[:, :, 0]
+
+        if not self.valid(seq):
+            return None
+
+        return seq, timestamp, image
+
+    def valid(self, seq: int) -> bool:
+        """
+        Checks that a frame was not overwritten
+
+        :param int seq: the frame sequence number
+        :return bool: True if the frame slot still contains the frame
+        """
+        return int(self.slot_seqs[seq % self.slots]) == seq
+
+    def wait(self, last_seq: int = -1, timeout: float = 1.0) -> bool:
+        """
+        Waits for a frame newer than last_seq (polling)
+
+        :param int last_seq: the sequence number of the last frame read
+        :param float timeout: maximum waiting duration [s]
+        :return bool: whether a newer frame is available
+        """
+        deadline = time.monotonic() + timeout
+        while self.seq <= last_seq and not self.closed:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+
+        return self.seq > last_seq
+
+    def close(self):
+        """
+        Detaches from the shared memory, removing it if it was created by this ring
+        """
+        if self.owner:
+            self.header[5] = 1
+
+        self.header = None
+        self.slot_seqs = None
+        self.slot_timestamps = None
+        self.images = None
+        self.memory.close()
+
+        if self.owner:
+            self.memory.unlink()
+            owned_names.discard(self.name)
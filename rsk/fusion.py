@@ -0,0 +1,180 @@
+import time
+import threading
+import numpy as np
+from . import state
+
+
+class CameraState:
+    """
+    Stands for the State in the detection of one camera, its markers and ball are passed to
+    the fusion instead
+    """
+
+    def __init__(self, fusion, name: str):
+        self.fusion = fusion
+        self.name: str = name
+
+    def set_markers(self, markers: dict, seq: int = None, timestamp: float = None):
+        self.fusion.update(self.name, "markers", markers, seq, timestamp)
+
+    def set_ball(self, position, seq: int = None, timestamp: float = None):
+        self.fusion.update(self.name, "ball", position, seq, timestamp)
+
+    def publish(self):
+        self.fusion.publish(self.name)
+
+    def __getattr__(self, name: str):
+        return getattr(self.fusion.state, name)
+
+
+class Fusion:
+    """
+    Merges the detections of several cameras (each one having its own field calibration) into
+    one State. Detections of the same marker captured at about the same time as the most
+    recent one are averaged, as well as ball detections that are also close to each other,
+    else the most recent detection is used.
+    """
+
+    def __init__(self, state: state.State, max_age: float = 0.2):
+        """
+        :param State state: the fused state
+        :param float max_age: maximum age of the detections to merge [s]
+        """
+        self.state: state.State = state
+        self.max_age: float = max_age
+        # Maximum distance between ball detections to average them [m]
+        self.merge_distance: float = 0.05
+        # Maximum capture time difference between detections to average them (one frame
+        # period at 30 fps, older detections of moving objects would lag) [s]
+        self.merge_window: float = 1 / 30
+
+        # Last detections for each camera: {"markers": ..., "ball": ...}, each being a
+        # (value, seq, timestamp) tuple
+        self.cameras: dict = {}
+        # Sequence number of the fused states (the cameras frames sequences are unrelated)
+        self.seq: int = 0
+        self.lock = threading.Lock()
+
+    def camera(self, name: str) -> CameraState:
+        """
+        Registers a camera
+
+        :param str name: the camera name
+        :return CameraState: the state to use in the camera detection
+        """
+        with self.lock:
+            self.cameras[name] = {}
+
+        return CameraState(self, name)
+
+    def remove(self, name: str):
+        with self.lock:
+            if name in self.cameras:
+                del self.cameras[name]
+
+    def update(self, name: str, kind: str, value, seq: int, timestamp: float):
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        with self.lock:
+            if name in self.cameras:
+                self.cameras[name][kind] = (value, seq, timestamp)
+
+    def recent(self, kind: str) -> list:
+        """
+        Recent detections of all cameras, the most recent first
+
+        :param str kind: "markers" or "ball"
+        :return list: (camera, value, seq, timestamp) tuples
+        """
+        now = time.monotonic()
+        detections = [
+            (name, *detections[kind])
+            for name, detections in self.cameras.items()
+            if kind in detections and now - detections[kind][2] < self.max_age
+        ]
+
+        return sorted(detections, key=lambda detection: -detection[3])
+
+    def fuse_markers(self) -> dict:
+        """
+        Merges the markers of all cameras
+
+        :return dict: the markers, with the frames sequence numbers and capture timestamps of
+            the cameras detections that were merged ("cameras", indexed by camera name)
+        """
+        candidates = {}
+        for name, markers, seq, timestamp in self.recent("markers"):
+            for marker, infos in markers.items():
+                candidates.setdefault(marker, []).append((name, infos, seq, timestamp))
+
+        fused = {}
+        for marker, detections in candidates.items():
+            # Detections are sorted from the most recent
+            timestamp = detections[0][3]
+            detections = [
+                detection
+                for detection in detections
+                if timestamp - detection[3] <= self.merge_window
+            ]
+            positions = np.array([infos["position"] for _, infos, _, _ in detections])
+            orientations = np.array(
+                [infos["orientation"] for _, infos, _, _ in detections]
+            )
+
+            fused[marker] = {
+                "position": positions.mean(axis=0).tolist(),
+                "orientation": float(
+                    np.arctan2(np.sin(orientations).sum(), np.cos(orientations).sum())
+                ),
+                "timestamp": timestamp,
+                "cameras": {
+                    name: {"seq": camera_seq, "timestamp": camera_timestamp}
+                    for name, _, camera_seq, camera_timestamp in detections
+                },
+            }
+
+        return fused
+
+    def fuse_ball(self) -> tuple:
+        """
+        Merges the ball detections of all cameras
+
+        :return tuple: the ball position (None if not detected), seq and timestamp
+        """
+        detections = [
+            detection for detection in self.recent("ball") if detection[1] is not None
+        ]
+        if not detections:
+            return None, None, None
+
+        _, ball, seq, timestamp = detections[0]
+        positions = np.array([position for _, position, _, _ in detections])
+        timestamps = np.array([detection[3] for detection in detections])
+        close = (np.linalg.norm(positions - ball, axis=1) < self.merge_distance) & (
+            timestamp - timestamps <= self.merge_window
+        )
+
+        return positions[close].mean(axis=0).tolist(), seq, timestamp
+
+    def publish(self, name: str):
+        """
+        Publishes the fused state, called each time a camera has new detections. The state
+        frame gets the fusion sequence number, and the capture timestamp of the camera.
+
+        :param str name: the camera name
+        """
+        with self.lock:
+            markers = self.fuse_markers()
+            ball, _, ball_timestamp = self.fuse_ball()
+            _, _, timestamp = self.cameras.get(name, {}).get(
+                "markers", (None, None, None)
+            )
+            self.seq += 1
+
+            self.state.set_markers(markers, self.seq, timestamp)
+            if ball is None:
+                self.state.set_ball(None, self.seq, timestamp)
+            else:
+                self.state.set_ball(ball, self.seq, ball_timestamp)
+            self.state.publish()
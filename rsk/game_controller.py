@@ -6,7 +6,7 @@ import time
 import logging
 import threading
 import waitress
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, Response, send_from_directory, jsonify, request
 from flask_cors import CORS
 from .backend import Backend
 from . import api, robot_wifi, config
@@ -39,6 +39,18 @@ parser.add_argument(
 parser.add_argument(
     "--scheduler", "-S", type=str, default="", help="Game scheduler URL"
 )
+parser.add_argument(
+    "--source",
+    type=str,
+    default=None,
+    help="Frame source instead of the camera (camera:<index>, a video file, "
+    "a directory of images, synthetic or shm:<name>, with an optional loop: prefix)",
+)
+parser.add_argument(
+    "--fast",
+    action="store_true",
+    help="Process the frame source as fast as possible instead of in real time",
+)
 parser.add_argument(
     "--reset", "-r", action="store_true", help="Reset the configuration file"
 )
@@ -54,7 +66,9 @@ if (not args.dry) and (not args.simulated):
     robot_wifi.RobotWifi.start_service()
 
 has_client: bool = False
-backend: Backend = Backend(args.simulated, args.competition, args.scheduler)
+backend: Backend = Backend(
+    args.simulated, args.competition, args.scheduler, args.source, not args.fast
+)
 api.register(backend)
 
 # Starting a Flask app serving API requests and files of static/ directory
@@ -74,7 +88,8 @@ def handle_api():
         if command in api.methods:
             try:
                 method = api.methods[command]
-                for k in range(len(method["args"])):
+                # Trailing arguments with a default value may be omitted
+                for k in range(min(len(args), len(method["args"]))):
                     if method["args"][k] is not None:
                         args[k] = method["args"][k](args[k])
                 result = method["func"](*args)
@@ -88,6 +103,21 @@ def handle_api():
         return jsonify([0, "Error while processing command"])
 
 
+@app.route("/video.mjpg", methods=["GET"])
+def video_stream():
+    if args.simulated:
+        return Response("No video in simulation mode", status=404)
+
+    # Each viewer is holding a server thread
+    if sum(backend.video.viewers.values()) >= 4:
+        return Response("Too many video viewers", status=503)
+
+    return Response(
+        backend.video.stream(request.args.get("tier", "full")),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
+    )
+
+
 @app.route("/", methods=["GET"])
 def main():
     return send_from_directory(static, "index.html")
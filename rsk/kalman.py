@@ -0,0 +1,230 @@
+import threading
+import numpy as np
+from . import utils
+
+
+class FilterBank:
+    """
+    A bank of Kalman filters with a constant velocity model (the acceleration being a white
+    noise), one filter per tracked object (for instance markers, or the ball).
+
+    Each axis of an object (x, y, orientation) is filtered independently, so that the
+    prediction and correction steps are computed element-wise on all objects and axes at
+    once. The state of an axis is its value and rate, and its covariance is the symmetric
+    matrix [[var, cov], [cov, rate_var]].
+
+    Objects that are not measured anymore are predicted for max_dropout, and forgotten
+    afterwards.
+    """
+
+    def __init__(
+        self,
+        process_noise: list,
+        measurement_noise: list,
+        angular: list = [],
+        gate: float = None,
+        max_dropout: float = 0.25,
+    ):
+        """
+        :param list process_noise: acceleration noise spectral density of each axis
+        :param list measurement_noise: measurement standard deviation of each axis
+        :param list angular: indexes of the angular axes (wrapped in [-pi, pi])
+        :param float gate: maximum distance (on the non angular axes) between a measurement
+            and the prediction, the filter is reset beyond it (None to never reset)
+        :param float max_dropout: duration an object is predicted without measurement [s]
+        """
+        self.process_noise: np.ndarray = np.array(process_noise, dtype=float)
+        self.measurement_noise: np.ndarray = (
+            np.array(measurement_noise, dtype=float) ** 2
+        )
+        self.axes: int = len(process_noise)
+        self.angular: np.ndarray = np.isin(np.arange(self.axes), angular)
+        self.gate: float = gate
+        self.max_dropout: float = max_dropout
+        # Initial rate variance of new objects
+        self.initial_rate_variance: np.ndarray = self.process_noise
+
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # Objects names, and their index in the arrays
+            self.names: list = []
+            self.indexes: dict = {}
+            # Values and rates (objects x axes)
+            self.values: np.ndarray = np.zeros((0, self.axes))
+            self.rates: np.ndarray = np.zeros((0, self.axes))
+            # Covariances (objects x axes)
+            self.variances: np.ndarray = np.zeros((0, self.axes))
+            self.covariances: np.ndarray = np.zeros((0, self.axes))
+            self.rate_variances: np.ndarray = np.zeros((0, self.axes))
+            # Time of the last measurement of each object (monotonic) [s]
+            self.timestamps: np.ndarray = np.zeros(0)
+
+    def wrap(self, values: np.ndarray) -> np.ndarray:
+        """
+        Wraps the angular axes of values (objects x axes)
+        """
+        if self.angular.any():
+            values[:, self.angular] = utils.angle_wrap(values[:, self.angular])
+
+        return values
+
+    def add(self, names: list, values: np.ndarray, timestamps: np.ndarray):
+        """
+        Adds new objects, with a null rate
+        """
+        for name in names:
+            self.indexes[name] = len(self.names)
+            self.names.append(name)
+
+        count = len(names)
+        self.values = np.vstack([self.values, values])
+        self.rates = np.vstack([self.rates, np.zeros((count, self.axes))])
+        self.variances = np.vstack(
+            [self.variances, np.tile(self.measurement_noise, (count, 1))]
+        )
+        self.covariances = np.vstack([self.covariances, np.zeros((count, self.axes))])
+        self.rate_variances = np.vstack(
+            [self.rate_variances, np.tile(self.initial_rate_variance, (count, 1))]
+        )
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+
+    def remove(self, keep: np.ndarray):
+        """
+        Removes objects
+
+        :param np.ndarray keep: mask of the objects to keep
+        """
+        self.names = [name for name, kept in zip(self.names, keep) if kept]
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+        for attribute in [
+            "values",
+            "rates",
+            "variances",
+            "covariances",
+            "rate_variances",
+            "timestamps",
+        ]:
+            setattr(self, attribute, getattr(self, attribute)[keep])
+
+    def predict(self, indexes: np.ndarray, timestamps: np.ndarray) -> tuple:
+        """
+        Predicts the state of objects (without updating them)
+
+        :param np.ndarray indexes: the objects indexes
+        :param np.ndarray timestamps: the prediction time of each object [s]
+        :return tuple: values, rates, variances, covariances and rate variances
+        """
+        dt = np.maximum(timestamps - self.timestamps[indexes], 0)[:, None]
+        q = self.process_noise * np.ones_like(dt)
+        variances = self.variances[indexes]
+        covariances = self.covariances[indexes]
+        rate_variances = self.rate_variances[indexes]
+
+        return (
+            self.wrap(self.values[indexes] + self.rates[indexes] * dt),
+            self.rates[indexes],
+            variances + 2 * dt * covariances + dt**2 * rate_variances + q * dt**3 / 3,
+            covariances + dt * rate_variances + q * dt**2 / 2,
+            rate_variances + q * dt,
+        )
+
+    def update(self, measurements: dict, timestamps: dict):
+        """
+        Corrects the filters with new measurements, creating the filters of new objects.
+        Measurements that are not newer than the last one of their object are ignored.
+
+        :param dict measurements: measured values (one per axis), indexed by object name
+        :param dict timestamps: the measurements times (monotonic), indexed by object name [s]
+        """
+        with self.lock:
+            known = [
+                name
+                for name in measurements
+                if name in self.indexes
+                and timestamps[name] > self.timestamps[self.indexes[name]]
+            ]
+            new = [name for name in measurements if name not in self.indexes]
+
+            if known:
+                indexes = np.array([self.indexes[name] for name in known])
+                z = np.array([measurements[name] for name in known], dtype=float)
+                t = np.array([timestamps[name] for name in known], dtype=float)
+                x, v, a, b, c = self.predict(indexes, t)
+
+                innovation = self.wrap(z - x)
+                gain = a / (a + self.measurement_noise)
+                rate_gain = b / (a + self.measurement_noise)
+
+                self.values[indexes] = self.wrap(x + gain * innovation)
+                self.rates[indexes] = v + rate_gain * innovation
+                self.variances[indexes] = (1 - gain) * a
+                self.covariances[indexes] = (1 - gain) * b
+                self.rate_variances[indexes] = c - rate_gain * b
+
+                # Objects that were lost for too long, or that jumped (for instance because
+                # they were moved by hand), are restarted from their measurement
+                restart = t - self.timestamps[indexes] > self.max_dropout
+                if self.gate is not None:
+                    restart |= (
+                        np.linalg.norm(innovation[:, ~self.angular], axis=1) > self.gate
+                    )
+                self.timestamps[indexes] = t
+                if restart.any():
+                    restarted = indexes[restart]
+                    self.values[restarted] = z[restart]
+                    self.rates[restarted] = 0
+                    self.variances[restarted] = self.measurement_noise
+                    self.covariances[restarted] = 0
+                    self.rate_variances[restarted] = self.initial_rate_variance
+
+            if new:
+                self.add(
+                    new,
+                    np.array([measurements[name] for name in new], dtype=float).reshape(
+                        -1, self.axes
+                    ),
+                    np.array([timestamps[name] for name in new], dtype=float),
+                )
+
+    def estimate(
+        self, timestamp: float, reference: float = None, extrapolate: bool = True
+    ) -> dict:
+        """
+        Estimates the state of the objects at a given time. Objects that were not measured
+        for more than max_dropout before the reference time are forgotten.
+
+        :param float timestamp: the estimation time (monotonic) [s]
+        :param float reference: the capture time of the latest processed frame, from which
+            dropouts are measured (so that the processing latency is not accounted),
+            defaults to the estimation time [s]
+        :param bool extrapolate: whether the objects are predicted to the estimation time,
+            or kept at their (filtered) last measurement
+        :return dict: (values, rates, age) tuples indexed by object name, age being the
+            duration between the last measurement and the estimation time [s]
+        """
+        if reference is None:
+            reference = timestamp
+
+        with self.lock:
+            lost = reference - self.timestamps > self.max_dropout
+            if lost.any():
+                self.remove(~lost)
+
+            indexes = np.arange(len(self.names))
+            timestamps = np.full(len(indexes), timestamp)
+            if not extrapolate:
+                timestamps = np.minimum(timestamps, self.timestamps)
+            values, rates, _, _, _ = self.predict(indexes, timestamps)
+            ages = np.maximum(timestamp - self.timestamps, 0)
+
+            return {
+                name: (
+                    values[index].tolist(),
+                    rates[index].tolist(),
+                    float(ages[index]),
+                )
+                for index, name in enumerate(self.names)
+            }
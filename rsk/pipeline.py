@@ -0,0 +1,182 @@
+import queue
+import threading
+import logging
+
+
+class Stage:
+    """
+    A pipeline stage, processing items from its (bounded) input queue in its own thread
+    """
+
+    def __init__(self, name: str, func, depth: int = 1):
+        self.logger: logging.Logger = logging.getLogger("pipeline")
+
+        # Stage name and processing function (item -> item, None to discard the item)
+        self.name: str = name
+        self.func = func
+
+        # Input queue
+        self.depth: int = depth
+        self.queue: queue.Queue = queue.Queue(depth)
+
+        # Next stage (None for the last one)
+        self.next: Stage = None
+
+        # Number of processed items and whether an item is being processed
+        self.processed: int = 0
+        self.busy: bool = False
+
+        # When set, an item put in the full queue replaces the oldest pending one instead of
+        # waiting for room, so that items never wait behind stale ones (see Pipeline.latest)
+        self.latest: bool = False
+        self.dropped: int = 0
+
+        self.running = False
+        self.thread: threading.Thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=lambda: self.process(), daemon=True, name=f"Pipeline-{self.name}"
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def join(self):
+        """
+        Waits for the stage thread to exit (after stop)
+        """
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def put(self, item) -> bool:
+        """
+        Puts an item in the stage input queue, waiting for room if the queue is full (or
+        replacing the oldest pending item, see latest)
+
+        :param item: the item to process
+        :return bool: whether the item was queued (False if the stage was stopped meanwhile)
+        """
+        while self.running and self.latest:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+        while self.running:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def process(self):
+        """
+        Stage thread, processing items and passing them to the next stage
+        """
+        while self.running:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self.busy = True
+            try:
+                item = self.func(item)
+            except Exception as e:
+                self.logger.error(f"Error in stage {self.name}: {e}")
+                item = None
+            self.busy = False
+            self.processed += 1
+
+            if item is not None and self.next is not None:
+                self.next.put(item)
+
+    def stats(self) -> dict:
+        """
+        Stage statistics
+
+        :return dict: queue depth and occupancy, processed items and busy state
+        """
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "occupancy": self.queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "busy": self.busy,
+        }
+
+
+class Pipeline:
+    """
+    A chain of stages connected with bounded queues, each stage running in its own thread.
+    Items are processed in order, and several items can be in flight in different stages.
+
+    With real-time items (such as camera frames), the pipeline should keep only the latest
+    items: an item reaching a full queue then replaces the pending one instead of waiting,
+    so that the latency is not raised by items queued in front of the slowest stage.
+    """
+
+    def __init__(self, stages: list, depth: int = 1, latest: bool = False):
+        """
+        :param list stages: list of (name, function) tuples
+        :param int depth: depth of the queue in front of each stage
+        :param bool latest: whether only the latest items are kept (see set_latest)
+        """
+        self.stages: list = [Stage(name, func, depth) for name, func in stages]
+        self.set_latest(latest)
+
+        for stage, next_stage in zip(self.stages[:-1], self.stages[1:]):
+            stage.next = next_stage
+
+        for stage in self.stages:
+            stage.start()
+
+    def set_latest(self, latest: bool):
+        """
+        Sets whether only the latest items are kept: items reaching a full queue replace the
+        pending ones (which are counted as dropped) instead of waiting for room
+
+        :param bool latest: whether only the latest items are kept
+        """
+        for stage in self.stages:
+            stage.latest = latest
+
+    def push(self, item) -> bool:
+        """
+        Pushes an item in the pipeline, waiting for room in the first stage queue (or
+        replacing its pending item, see set_latest)
+
+        :param item: the item to process
+        :return bool: whether the item was pushed
+        """
+        return self.stages[0].put(item)
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def join(self):
+        """
+        Waits for the stages threads to exit (after stop), no item is processed afterwards
+        """
+        for stage in self.stages:
+            stage.join()
+
+    def stats(self) -> list:
+        """
+        Statistics for all stages
+
+        :return list: a list of stats (see Stage.stats)
+        """
+        return [stage.stats() for stage in self.stages]
@@ -634,7 +634,8 @@ class Referee:
         last_tick = time.time()
 
         while True:
-            self.state_info = copy.deepcopy(self.state.get_state())
+            # Objects are not extrapolated, so that a hidden ball does not cross lines
+            self.state_info = copy.deepcopy(self.state.get_state(extrapolate=False))
             self.state.set_referee(self.get_game_state())
             self.control.allow_extra_features = not self.game_state["game_is_running"]
 
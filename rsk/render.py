@@ -0,0 +1,339 @@
+import numpy as np
+import cv2
+from . import constants, field, client, utils
+
+# ArUco (4x4_50) marker ids of the field items, as expected by the detection
+marker_ids: dict = {
+    "c1": 0,
+    "c2": 1,
+    "c3": 2,
+    "c4": 3,
+    "green1": 4,
+    "green2": 5,
+    "blue1": 6,
+    "blue2": 7,
+    **{f"obj{number}": 7 + number for number in range(1, 9)},
+}
+
+
+class Renderer:
+    """
+    Renders synthetic images of the field seen by a virtual camera: corner tags, robots (with
+    their tags) and ball. The images can be processed by the detection, the objects poses
+    being the ground truth.
+    """
+
+    def __init__(
+        self,
+        size: tuple = (1920, 1080),
+        focal: float = None,
+        camera_position: tuple = (0.0, 0.0, 2.0),
+        camera_yaw: float = 0.0,
+        camera_tilt: float = 0.0,
+    ):
+        """
+        :param tuple size: image size (width, height)
+        :param float focal: focal [px], defaults to the default camera focal (885 px at 1080p)
+        :param tuple camera_position: camera position in the field frame [m]
+        :param float camera_yaw: camera rotation around the vertical axis [rad]
+        :param float camera_tilt: camera rotation around its horizontal axis [rad] (0 when
+            looking straight down)
+        """
+        self.size: tuple = tuple(size)
+        self.focal: float = 885 * size[1] / 1080 if focal is None else focal
+        self.intrinsic = np.array(
+            [
+                [self.focal, 0, size[0] / 2],
+                [0, self.focal, size[1] / 2],
+                [0, 0, 1],
+            ]
+        )
+
+        # World to camera transformation, the camera looking down with its x axis along the
+        # field x axis (when yaw is 0)
+        cos_yaw, sin_yaw = np.cos(camera_yaw), np.sin(camera_yaw)
+        cos_tilt, sin_tilt = np.cos(camera_tilt), np.sin(camera_tilt)
+        yaw = np.array([[cos_yaw, -sin_yaw, 0], [sin_yaw, cos_yaw, 0], [0, 0, 1]])
+        tilt = np.array([[1, 0, 0], [0, cos_tilt, -sin_tilt], [0, sin_tilt, cos_tilt]])
+        self.rotation = tilt @ np.diag([1.0, -1.0, -1.0]) @ yaw.T
+        self.translation = -self.rotation @ np.array(camera_position, dtype=float)
+
+        # Background: carpet and field lines
+        self.background_color = (40, 120, 40)
+        self.line_color = (230, 230, 230)
+        self.robot_color = (50, 50, 50)
+        self.ball_color = (0, 110, 255)
+
+        self.corner_positions: dict = field.Field().corner_field_positions
+        # Cached tags images and noise
+        self.tags: dict = {}
+        self.background = self.render_background()
+
+    def project(self, points) -> np.ndarray:
+        """
+        Projects points of the field frame to the image
+
+        :param points: the points (N x 3) [m]
+        :return np.ndarray: the pixels (N x 2)
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        camera = points @ self.rotation.T + self.translation
+        pixels = camera @ self.intrinsic.T
+
+        return pixels[:, :2] / pixels[:, 2:]
+
+    def tag(self, marker_id: int) -> np.ndarray:
+        """
+        ArUco tag image (cached)
+
+        :param int marker_id: the marker id
+        :return np.ndarray: the tag image (BGR)
+        """
+        if marker_id not in self.tags:
+            dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+            if hasattr(cv2.aruco, "generateImageMarker"):
+                image = cv2.aruco.generateImageMarker(dictionary, marker_id, 120)
+            else:
+                image = cv2.aruco.drawMarker(dictionary, marker_id, 120)
+            self.tags[marker_id] = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+        return self.tags[marker_id]
+
+    def paste(self, image: np.ndarray, source: np.ndarray, corners):
+        """
+        Pastes a (square) image on a quadrilateral, the transformation being computed on its
+        bounding box only
+
+        :param np.ndarray image: the destination image
+        :param np.ndarray source: the image to paste
+        :param corners: the destination corners, matching the source top left, top right,
+            bottom right and bottom left corners
+        """
+        corners = np.float32(corners)
+        height, width = image.shape[:2]
+        x_min, y_min = np.maximum(np.floor(corners.min(axis=0)).astype(int), 0)
+        x_max, y_max = np.minimum(
+            np.ceil(corners.max(axis=0)).astype(int) + 1, [width, height]
+        )
+        if x_max <= x_min or y_max <= y_min:
+            return
+
+        size = source.shape[0]
+        transformation = cv2.getPerspectiveTransform(
+            np.float32([[0, 0], [size, 0], [size, size], [0, size]]),
+            np.float32(corners - [x_min, y_min]),
+        )
+        roi_size = (int(x_max - x_min), int(y_max - y_min))
+        warped = cv2.warpPerspective(source, transformation, roi_size)
+        mask = cv2.warpPerspective(
+            np.full(source.shape[:2], 255, np.uint8), transformation, roi_size
+        )
+        roi = image[y_min:y_max, x_min:x_max]
+        roi[mask > 127] = warped[mask > 127]
+
+    def render_background(self) -> np.ndarray:
+        """
+        Renders the static part of the image: carpet, field lines and corner tags
+
+        :return np.ndarray: the image
+        """
+        image = np.full(
+            (self.size[1], self.size[0], 3), self.background_color, np.uint8
+        )
+
+        x, y = constants.field_length / 2, constants.field_width / 2
+        lines = self.project([[x, y, 0], [x, -y, 0], [-x, -y, 0], [-x, y, 0]])
+        cv2.polylines(
+            image, [np.int32(lines)], True, self.line_color, 2, lineType=cv2.LINE_AA
+        )
+        line = self.project([[0, y, 0], [0, -y, 0]])
+        cv2.line(image, *np.int32(line).tolist(), self.line_color, 2, cv2.LINE_AA)
+
+        white = np.full((8, 8, 3), 255, np.uint8)
+        border = constants.corner_tag_border
+        for corner, positions in self.corner_positions.items():
+            positions = np.array(positions)
+            center = positions.mean(axis=0)
+            # White border around the tag
+            outer = center + (positions - center) * (
+                1 + 2 * border / constants.corner_tag_size
+            )
+            self.paste(image, white, self.project(np.c_[outer, np.zeros(4)]))
+            self.paste(
+                image,
+                self.tag(marker_ids[corner]),
+                self.project(np.c_[positions, np.zeros(4)]),
+            )
+
+        return image
+
+    def circle(self, image: np.ndarray, center, radius: float, color: tuple):
+        """
+        Draws a horizontal disc
+
+        :param np.ndarray image: the image
+        :param center: disc center (x, y, z) [m]
+        :param float radius: disc radius [m]
+        :param tuple color: the color
+        """
+        angles = np.linspace(0, 2 * np.pi, 32, endpoint=False)
+        points = np.c_[
+            center[0] + radius * np.cos(angles),
+            center[1] + radius * np.sin(angles),
+            np.full(len(angles), center[2]),
+        ]
+        pixels = np.int32(np.round(self.project(points) * 16))
+        cv2.fillPoly(image, [pixels], color, lineType=cv2.LINE_AA, shift=4)
+
+    def render(self, objects: dict, noise: float = 0) -> np.ndarray:
+        """
+        Renders an image
+
+        :param dict objects: the objects poses, either simulated objects (see
+            Simulator.objects) or (x, y, orientation) tuples, indexed by marker name ("ball"
+            for the ball, whose orientation is ignored)
+        :param float noise: standard deviation of a gaussian noise added to the image
+        :return np.ndarray: the image
+        """
+        image = self.background.copy()
+
+        for name, pose in poses(objects).items():
+            x, y, orientation = pose
+            if name == "ball":
+                self.circle(
+                    image,
+                    (x, y, constants.ball_height),
+                    constants.ball_radius,
+                    self.ball_color,
+                )
+            elif name in marker_ids:
+                self.circle(
+                    image,
+                    (x, y, constants.robot_height),
+                    constants.robot_radius,
+                    self.robot_color,
+                )
+                self.paste(image, self.robot_tag(name), self.tag_corners(pose))
+
+        if noise > 0:
+            positive, negative = self.noise(noise)
+            cv2.add(image, positive, dst=image)
+            cv2.subtract(image, negative, dst=image)
+
+        return image
+
+    def noise(self, deviation: float) -> tuple:
+        """
+        Gaussian noise, picked from a few pre-generated frames since generating it is much
+        slower than rendering
+
+        :param float deviation: the noise standard deviation
+        :return tuple: the positive and negative parts of the noise (uint8 images)
+        """
+        key = ("noise", deviation)
+        if key not in self.tags:
+            self.tags[key] = []
+            for _ in range(4):
+                gaussian = np.random.normal(
+                    0, deviation, (self.size[1], self.size[0], 3)
+                )
+                self.tags[key].append(
+                    (
+                        np.clip(gaussian, 0, 255).astype(np.uint8),
+                        np.clip(-gaussian, 0, 255).astype(np.uint8),
+                    )
+                )
+
+        return self.tags[key][np.random.randint(len(self.tags[key]))]
+
+    def robot_tag(self, name: str) -> np.ndarray:
+        """
+        Robot tag image, with its white border
+
+        :param str name: the marker name
+        :return np.ndarray: the image
+        """
+        key = ("robot", name)
+        if key not in self.tags:
+            tag = self.tag(marker_ids[name])
+            border = tag.shape[0] // 4
+            self.tags[key] = cv2.copyMakeBorder(
+                tag,
+                border,
+                border,
+                border,
+                border,
+                cv2.BORDER_CONSTANT,
+                value=(255,) * 3,
+            )
+
+        return self.tags[key]
+
+    def tag_corners(self, pose) -> np.ndarray:
+        """
+        Pixels of the corners of a robot tag (including its white border), its front being
+        the first two corners
+
+        :param pose: the robot pose (x, y, orientation)
+        :return np.ndarray: the pixels (4 x 2)
+        """
+        x, y, orientation = pose
+        # The white border is a quarter of the tag on each side
+        half = constants.robot_tag_size * 1.5 / 2
+        rotation = np.array(
+            [
+                [np.cos(orientation), -np.sin(orientation)],
+                [np.sin(orientation), np.cos(orientation)],
+            ]
+        )
+        corners = np.array([[half, half], [half, -half], [-half, -half], [-half, half]])
+        corners = corners @ rotation.T + [x, y]
+
+        return self.project(np.c_[corners, np.full(4, constants.robot_height)])
+
+
+def poses(objects: dict) -> dict:
+    """
+    Poses of objects
+
+    :param dict objects: simulated objects (see Simulator.objects) or (x, y, orientation)
+        tuples, indexed by marker name
+    :return dict: (x, y, orientation) tuples, indexed by marker name
+    """
+    return {
+        name: tuple(float(value) for value in getattr(entry, "position", entry)[:3])
+        for name, entry in objects.items()
+    }
+
+
+def ground_truth(objects: dict) -> dict:
+    """
+    Expected detection of objects, in the same format as the State
+
+    :param dict objects: the objects (see poses)
+    :return dict: the markers (position and orientation) and the ball position
+    """
+    truth = {"markers": {}, "ball": None}
+    for name, (x, y, orientation) in poses(objects).items():
+        if name == "ball":
+            truth["ball"] = [x, y]
+        elif name in marker_ids:
+            truth["markers"][name] = {
+                "position": [x, y],
+                "orientation": utils.angle_wrap(orientation),
+            }
+
+    return truth
+
+
+def default_scene() -> dict:
+    """
+    A scene with the robots at their game positions and the ball slightly off the center
+
+    :return dict: the objects poses
+    """
+    objects = {"ball": (0.1, 0.05, 0.0)}
+    for team, number, pose in client.configurations["game_green_positive"]:
+        objects[utils.robot_list2str(team, number)] = tuple(pose)
+
+    return objects
@@ -0,0 +1,288 @@
+import os
+import time
+import numpy as np
+import cv2
+from . import frame_ring, render
+
+image_extensions = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+video_extensions = (".avi", ".mp4", ".mkv", ".mov", ".mjpeg", ".mjpg")
+
+
+class Source:
+    """
+    A frame source, that can be used in place of a cv2.VideoCapture by the video (read,
+    grab, retrieve, set and release methods).
+
+    Real-time sources deliver the frames at their frame rate, while the other ones deliver
+    them as fast as they are consumed (the video waits for each frame to be processed
+    instead of dropping them).
+    """
+
+    def __init__(self, fps: float = 30, realtime: bool = True):
+        # Frame rate (None if the frames are paced by the source itself)
+        self.fps: float = fps
+        self.realtime: bool = realtime
+        # Frames size (width, height), if known
+        self.size: tuple = None
+
+        # Number of delivered frames, and the time the next one is due
+        self.index: int = 0
+        self.next_time: float = None
+
+    def frame(self) -> np.ndarray:
+        """
+        Produces the next frame
+
+        :return np.ndarray: the frame, None if there is no more frames
+        """
+        raise NotImplementedError
+
+    def pace(self):
+        """
+        Waits for the next frame to be due (real-time sources)
+        """
+        if not self.realtime or not self.fps:
+            return
+
+        now = time.monotonic()
+        if self.next_time is None or now - self.next_time > 1.0:
+            self.next_time = now
+        elif now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time += 1 / self.fps
+
+    def grab(self) -> bool:
+        """
+        Waits for the next frame, like cv2.VideoCapture.grab (it is produced by retrieve)
+
+        :return bool: whether a frame can be retrieved
+        """
+        self.pace()
+        return True
+
+    def retrieve(self):
+        """
+        Produces the grabbed frame, like cv2.VideoCapture.retrieve
+
+        :return: a (success, frame) tuple
+        """
+        image = self.frame()
+        if image is None:
+            return False, None
+
+        self.index += 1
+        return True, image
+
+    def read(self):
+        """
+        Reads the next frame, like cv2.VideoCapture.read
+
+        :return: a (success, frame) tuple
+        """
+        self.grab()
+        return self.retrieve()
+
+    def set(self, prop: int, value) -> bool:
+        # Camera properties are ignored
+        return False
+
+    def get(self, prop: int) -> float:
+        if self.size is not None:
+            if prop == cv2.CAP_PROP_FRAME_WIDTH:
+                return self.size[0]
+            if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+                return self.size[1]
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps or 0
+
+        return 0
+
+    def release(self):
+        pass
+
+
+class VideoFileSource(Source):
+    """
+    Frames from a video file
+    """
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Can't open video file {path}")
+
+        super().__init__(self.capture.get(cv2.CAP_PROP_FPS) or 30, realtime)
+        self.loop: bool = loop
+        self.size = (
+            int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+
+    def frame(self) -> np.ndarray:
+        grabbed, image = self.capture.read()
+        if not grabbed and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            grabbed, image = self.capture.read()
+
+        return image if grabbed else None
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource(Source):
+    """
+    Frames from the images of a directory, in alphabetical order
+    """
+
+    def __init__(
+        self, path: str, fps: float = 30, realtime: bool = True, loop: bool = False
+    ):
+        super().__init__(fps, realtime)
+        self.loop: bool = loop
+        self.files: list = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(image_extensions)
+        )
+        if not self.files:
+            raise ValueError(f"No images in directory {path}")
+
+        image = cv2.imread(self.files[0])
+        self.size = (image.shape[1], image.shape[0])
+
+    def frame(self) -> np.ndarray:
+        if self.index >= len(self.files):
+            if not self.loop:
+                return None
+            self.index = 0
+
+        return cv2.imread(self.files[self.index])
+
+
+class SyntheticSource(Source):
+    """
+    Generated frames
+    """
+
+    def __init__(
+        self,
+        render=None,
+        size: tuple = (1920, 1080),
+        fps: float = 30,
+        realtime: bool = True,
+    ):
+        """
+        :param render: a function producing the frame of a given index, defaults to gray
+            frames
+        :param tuple size: frames size (width, height)
+        :param float fps: frame rate
+        :param bool realtime: whether the frames are delivered at the frame rate
+        """
+        super().__init__(fps, realtime)
+        self.render = render
+        self.size = tuple(size)
+
+    def frame(self) -> np.ndarray:
+        if self.render is None:
+            return np.full((self.size[1], self.size[0], 3), 128, np.uint8)
+
+        return self.render(self.index)
+
+
+class SharedMemorySource(Source):
+    """
+    Frames from a shared memory ring written by another process (see FrameRing), the
+    frames are paced by the producer
+    """
+
+    def __init__(self, name: str, realtime: bool = True, timeout: float = 1.0):
+        super().__init__(None, realtime)
+        self.ring: frame_ring.FrameRing = frame_ring.FrameRing(name)
+        self.size = (self.ring.shape[1], self.ring.shape[0])
+        self.timeout: float = timeout
+        self.seq: int = -1
+
+    def grab(self) -> bool:
+        # Waiting for the producer to write a new frame, that is copied by retrieve
+        if not self.ring.closed:
+            self.ring.wait(self.seq, self.timeout)
+        return True
+
+    def frame(self) -> np.ndarray:
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.ring.closed:
+                # The producer created a new ring
+                try:
+                    self.ring.close()
+                    self.ring = frame_ring.FrameRing(self.ring.name)
+                    self.seq = -1
+                except FileNotFoundError:
+                    time.sleep(0.01)
+                    continue
+
+            entry = self.ring.read(self.seq)
+            if entry is not None:
+                self.seq, _, image = entry
+                return image
+            self.ring.wait(self.seq, max(0, deadline - time.monotonic()))
+
+        return None
+
+    def release(self):
+        self.ring.close()
+
+
+def camera_index(spec: str) -> int:
+    """
+    The camera index of a source specification
+
+    :param str spec: the source specification (see open_source)
+    :return int: the camera index, None if the source is not a camera
+    """
+    if spec.startswith("camera:"):
+        spec = spec[len("camera:") :]
+
+    return int(spec) if spec.isdigit() else None
+
+
+def open_source(spec: str, realtime: bool = True):
+    """
+    Opens a frame source from its specification:
+
+    - "camera:<index>" or "<index>": a camera (cv2.VideoCapture)
+    - "file:<path>" or a video file path: a video file
+    - "dir:<path>" or a directory path: a directory of images
+    - "synthetic": generated frames (the default scene, see render.default_scene)
+    - "shm:<name>": a shared memory frame ring
+
+    The "loop:" prefix can be added to loop file and directory sources.
+
+    :param str spec: the source specification
+    :param bool realtime: whether the frames are delivered in real time (else, as fast as
+        they are processed)
+    :return: the source
+    """
+    loop = spec.startswith("loop:")
+    if loop:
+        spec = spec[len("loop:") :]
+
+    kind, _, value = spec.partition(":")
+    if kind not in ("camera", "file", "dir", "shm"):
+        kind, value = "", spec
+
+    if kind == "camera" or (kind == "" and value.isdigit()):
+        return cv2.VideoCapture(int(value))
+    elif kind == "file" or (kind == "" and value.lower().endswith(video_extensions)):
+        return VideoFileSource(value, realtime, loop)
+    elif kind == "dir" or (kind == "" and os.path.isdir(value)):
+        return ImageDirectorySource(value, realtime=realtime, loop=loop)
+    elif value == "synthetic":
+        renderer = render.Renderer()
+        image = renderer.render(render.default_scene())
+        return SyntheticSource(lambda index: image, renderer.size, realtime=realtime)
+    elif kind == "shm":
+        return SharedMemorySource(value, realtime)
+    else:
+        raise ValueError(f"Unknown frame source: {spec}")
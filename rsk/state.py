@@ -1,5 +1,6 @@
 import zmq
 import time
+from . import kalman, config
 
 
 class State:
@@ -9,7 +10,14 @@ class State:
         Args:
             frequency_pub (int, optional): publication frequency [Hz]
         """
+        # Markers store, with the last detection of each marker (its "timestamp" being the
+        # capture time of the frame it was last seen in). Markers are kept until they were
+        # not seen for marker_hold_time before the latest processed frame, so that a missed
+        # detection does not make them disappear.
         self.markers: dict = {}
+        self.marker_hold_time: float = config.config.get("state", {}).get(
+            "marker_hold_time", 0.25
+        )
         self.ball = None
         self.last_updates: dict = {}
         self.referee: dict = {}
@@ -19,13 +27,138 @@ class State:
         self.last_time = None
         self.leds: dict = {}
 
-    def get_state(self):
+        # Sequence number and monotonic capture timestamp of the latest frame
+        self.frame: dict = {"seq": None, "timestamp": None}
+
+        # Filters smoothing the markers poses (x, y, orientation) and the ball position, and
+        # estimating their velocities. They also bridge short detection dropouts. When they
+        # are disabled, the last detections are used as they are (the simulator poses being
+        # exact, they are not filtered by default).
+        self.filtering: bool = not simulated and config.config.get("state", {}).get(
+            "filtering", True
+        )
+        self.markers_filter: kalman.FilterBank = kalman.FilterBank(
+            [1.0, 1.0, 5.0],
+            [0.003, 0.003, 0.03],
+            angular=[2],
+            gate=0.3,
+            max_dropout=self.marker_hold_time,
+        )
+        self.ball_filter: kalman.FilterBank = kalman.FilterBank(
+            [10.0, 10.0], [0.005, 0.005], gate=0.3, max_dropout=0.35
+        )
+
+    def get_markers(self, timestamp: float, extrapolate: bool = True) -> dict:
+        """
+        Markers seen in the last marker_hold_time before the latest processed frame, filtered
+        and extrapolated to a given time. The hold is applied by the markers filter, so
+        that all the published markers have the same fields.
+
+        :param float timestamp: the time (monotonic) [s]
+        :param bool extrapolate: whether the markers are extrapolated to the given time, or
+            kept at their last detection
+        :return dict: the markers, with their velocity [m/s], angular velocity [rad/s] and
+            age (duration between their last detection and the given time) [s]
+        """
+        store = self.markers
+        if not self.filtering:
+            return {
+                marker: {
+                    **infos,
+                    "velocity": None,
+                    "angular_velocity": None,
+                    "age": max(timestamp - infos["timestamp"], 0),
+                }
+                for marker, infos in store.items()
+            }
+
+        markers = {}
+        for marker, (values, rates, age) in self.markers_filter.estimate(
+            timestamp, self.frame["timestamp"], extrapolate
+        ).items():
+            if marker in store:
+                markers[marker] = {
+                    **store[marker],
+                    "position": values[:2],
+                    "orientation": values[2],
+                    "velocity": rates[:2],
+                    "angular_velocity": rates[2],
+                    "age": age,
+                }
+
+        return markers
+
+    def set_marker_hold_time(self, duration: float):
+        """
+        Sets the duration markers are kept after they were last seen
+
+        :param float duration: the duration [s]
+        """
+        self.marker_hold_time = duration
+        self.markers_filter.max_dropout = duration
+        config.config.setdefault("state", {})["marker_hold_time"] = duration
+        config.save()
+
+    def set_filtering(self, enabled: bool):
+        """
+        Enables or disables the markers and ball filters
+
+        :param bool enabled: whether the filters are used
+        """
+        if enabled and not self.filtering:
+            # The filters were not updated while disabled
+            self.markers_filter.reset()
+            self.ball_filter.reset()
+        self.filtering = enabled
+        config.config.setdefault("state", {})["filtering"] = enabled
+        config.save()
+
+    def get_ball(self, timestamp: float = None, extrapolate: bool = True) -> tuple:
+        """
+        Filtered ball, extrapolated to a given time. The ball is lost when it was not seen
+        for max_dropout before the latest processed frame.
+
+        :param float timestamp: the time (monotonic) [s], defaults to now
+        :param bool extrapolate: whether the ball is extrapolated to the given time, or kept
+            at its last detection
+        :return tuple: the ball position and velocity [m/s] (None if the ball is lost)
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        if not self.filtering:
+            return self.ball, None
+
+        estimates = self.ball_filter.estimate(
+            timestamp, self.frame["timestamp"], extrapolate
+        )
+        if "ball" not in estimates:
+            return None, None
+
+        values, rates, _ = estimates["ball"]
+        return values, rates
+
+    def get_state(self, timestamp: float = None, extrapolate: bool = True):
+        """
+        The state, the markers and ball being extrapolated to the given time
+
+        :param float timestamp: the time (monotonic) [s], defaults to now
+        :param bool extrapolate: whether the markers and ball are extrapolated, or kept at
+            their last detection (so that an object that is not seen does not keep moving,
+            as needed by the referee)
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        ball, ball_velocity = self.get_ball(timestamp, extrapolate)
+
         return {
-            "markers": self.markers,
-            "ball": self.ball,
+            "markers": self.get_markers(timestamp, extrapolate),
+            "ball": ball,
+            "ball_velocity": ball_velocity,
             "referee": self.referee,
             "leds": self.leds,
             "simulated": self.simulated,
+            "frame": self.frame,
         }
 
     def start_pub(self):
@@ -41,27 +174,91 @@ class State:
         Publish the detection informations on the network
         """
         self.last_time = time.time()
-        info = self.get_state()
+        # Monotonic publication time, so that clients can compute the age of the frames
+        now = time.monotonic()
+        info = self.get_state(now)
+        info["time"] = now
         self.socket.send_json(info, flags=zmq.NOBLOCK)
 
-    def set_markers(self, markers):
-        self.markers = markers
+    def set_frame(self, seq: int = None, timestamp: float = None) -> float:
+        """
+        Sets the frame the next detections come from
+
+        :param int seq: the frame sequence number
+        :param float timestamp: the frame monotonic capture timestamp, defaults to now
+        :return float: the capture timestamp
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        self.frame = {"seq": seq, "timestamp": timestamp}
+
+        return timestamp
+
+    def set_markers(self, markers, seq: int = None, timestamp: float = None):
+        """
+        Updates the markers detected in a frame, the markers that are not in it are kept
+        until they were not seen for marker_hold_time
+
+        :param dict markers: the detected markers
+        """
+        timestamp = self.set_frame(seq, timestamp)
         for marker in markers:
+            # Markers may come from different frames (see fusion)
+            markers[marker].setdefault("seq", seq)
+            markers[marker].setdefault("timestamp", timestamp)
             self.last_updates[marker] = time.time()
 
+        # The store is replaced rather than modified, since it is read by other threads
+        self.markers = {
+            marker: infos
+            for marker, infos in {**self.markers, **markers}.items()
+            if timestamp - infos["timestamp"] <= self.marker_hold_time
+        }
+
+        if self.filtering:
+            self.markers_filter.update(
+                {
+                    marker: [*infos["position"], infos["orientation"]]
+                    for marker, infos in markers.items()
+                },
+                {marker: infos["timestamp"] for marker, infos in markers.items()},
+            )
+
     def set_leds(self, marker, leds):
         self.leds[marker] = leds
 
-    def set_marker(self, marker, position, orientation):
-        if marker not in self.markers:
-            self.markers[marker] = {"position": position, "orientation": orientation}
-        else:
-            self.markers[marker]["position"] = position
-            self.markers[marker]["orientation"] = orientation
+    def set_marker(
+        self, marker, position, orientation, seq: int = None, timestamp: float = None
+    ):
+        timestamp = self.set_frame(seq, timestamp)
+        self.markers = {
+            **self.markers,
+            marker: {
+                **self.markers.get(marker, {}),
+                "position": position,
+                "orientation": orientation,
+                "seq": seq,
+                "timestamp": timestamp,
+            },
+        }
         self.last_updates[marker] = time.time()
 
-    def set_ball(self, position):
+        if self.filtering:
+            self.markers_filter.update(
+                {marker: [*position, orientation]}, {marker: timestamp}
+            )
+
+    def set_ball(self, position, seq: int = None, timestamp: float = None):
+        """
+        Sets the ball position
+
+        :param position: the ball position, None if it is not seen in the frame (its
+            position is then extrapolated by the filter for a short time)
+        """
+        timestamp = self.set_frame(seq, timestamp)
         self.ball = position
+        if self.filtering and position is not None:
+            self.ball_filter.update({"ball": position}, {"ball": timestamp})
 
     def set_referee(self, referee):
         self.referee = referee
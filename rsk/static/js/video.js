@@ -1,7 +1,7 @@
 function video_initialize(backend)
 {
-    function updateCameras() {
-        backend.cameras(function(data) {
+    function updateCameras(refresh) {
+        backend.cameras(refresh === true, function(data) {
             indexes = data[0]
             favourite_index = data[1]
             let options = '';
@@ -29,8 +29,10 @@ function video_initialize(backend)
         });
     }
 
-    updateCameras();
-    $('.refresh-cameras').click(updateCameras);
+    updateCameras(false);
+    $('.refresh-cameras').click(function() {
+        updateCameras(true);
+    });
 
     function get_display_settings() {
         backend.get_display_settings(false, function(display_settings) {
@@ -100,17 +102,74 @@ function video_initialize(backend)
         backend.stop_capture();
     });
 
-    // Retrieving the images
+    // Retrieving the processing stages timings
+    setInterval(function() {
+        if (current_tab != 'vision' || !$('body').hasClass('vision-running')) {
+            return;
+        }
+
+        backend.get_video_timings(function(timings) {
+            let html = '<tr><th>Stage</th><th>p50</th><th>p95</th><th>p99</th><th>max</th></tr>';
+            for (let stage in timings) {
+                let timing = timings[stage];
+                html += '<tr><td>'+stage+'</td>';
+                for (let key of ['p50', 'p95', 'p99', 'max']) {
+                    html += '<td>'+timing[key].toFixed(1)+' ms</td>';
+                }
+                html += '</tr>';
+            }
+            $('.timings').html(html);
+        });
+    }, 1000);
+
+    // Streaming the images (MJPEG) only when they are visible, to the image of the current
+    // tab only (each stream holds a server thread, and their number is limited). If the
+    // stream is refused, the images are polled instead.
+    let streaming = null;
+    let polling = false;
+    $('.camera-image').on('error', function() {
+        if (this === streaming && $(this).attr('src') == 'video.mjpg') {
+            $(this).removeAttr('src');
+            polling = true;
+        }
+    });
+
+    function updateStream(running) {
+        let image = null;
+        if (running && (current_tab == 'vision' || current_tab == 'referee')) {
+            image = $('.page-'+current_tab+' .camera-image').get(0) || null;
+        }
+        if (image !== streaming) {
+            $('.camera-image').removeAttr('src');
+            streaming = image;
+            polling = false;
+            if (streaming) {
+                $(streaming).attr('src', 'video.mjpg');
+            }
+        }
+    }
+
+    setInterval(function() {
+        if (!polling || !streaming) {
+            return;
+        }
+
+        backend.get_image('full', function(image) {
+            if (image && polling && streaming) {
+                $(streaming).attr('src', 'data:image/jpeg;base64,'+image);
+            }
+        });
+    }, 50);
+
+    // Retrieving the video status
     setInterval(function() {
 
         is_vision = current_tab == 'vision' || 'referee';
         backend.enableVideoDebug(is_vision);
 
-        backend.get_video(is_vision, function(video) {
-            if (video.image) {
-                $('.camera-image').attr('src', 'data:image/jpeg;base64,'+video.image);
-            }
-        
+        backend.get_video(false, function(video) {
+            updateStream(video.running);
+
             if (video.running) {
                 $('body').addClass('vision-running');
             } else {
@@ -0,0 +1,63 @@
+import time
+import collections
+import contextlib
+import numpy as np
+
+
+class Timings:
+    """
+    Keeps the last durations of processing stages in ring buffers, to compute statistics
+    """
+
+    def __init__(self, size: int = 300):
+        # Number of durations kept per stage
+        self.size: int = size
+        self.durations: dict = {}
+
+    def add(self, stage: str, duration: float):
+        """
+        Records a stage duration
+
+        :param str stage: the stage name
+        :param float duration: the duration [s]
+        """
+        if stage not in self.durations:
+            self.durations[stage] = collections.deque(maxlen=self.size)
+        self.durations[stage].append(duration)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        """
+        Measures the duration of a block of code, to use with a with statement
+
+        :param str stage: the stage name
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def stats(self) -> dict:
+        """
+        Statistics on the recorded durations
+
+        :return dict: for each stage, percentiles (p50, p95, p99) and max in ms, and count
+        """
+        stats = {}
+        for stage in list(self.durations):
+            durations = 1000 * np.array(self.durations[stage])
+            if len(durations):
+                p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+                stats[stage] = {
+                    "p50": float(p50),
+                    "p95": float(p95),
+                    "p99": float(p99),
+                    "max": float(durations.max()),
+                    "count": len(durations),
+                }
+
+        return stats
+
+    def reset(self):
+        self.durations = {}
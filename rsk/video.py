@@ -3,8 +3,10 @@ import numpy as np
 import cv2
 import os
 import base64
+import queue
 import threading
-from . import detection, config
+import concurrent.futures
+from . import detection, config, pipeline, timings, sources, fusion, frame_ring
 
 resolutions = [
     (320, 240),
@@ -27,27 +29,384 @@ resolutions = [
 is_windows = os.name == "nt"
 
 
+class Frame:
+    """
+    A frame grabbed from the capture, travelling through the processing
+    """
+
+    def __init__(self, image, seq: int, timestamp: float):
+        # The captured image
+        self.image = image
+        # Sequence number of the frame (incremented for each grabbed frame)
+        self.seq: int = seq
+        # Monotonic capture timestamp [s]
+        self.timestamp: float = timestamp
+        # Time its processing started [s]
+        self.started: float = None
+
+        # Annotated image (None if debug is disabled)
+        self.image_debug = None
+        # Detection results
+        self.markers: dict = {}
+        self.ball = None
+
+
+class JpegCache:
+    """
+    Encodes the images to JPEG at most once per frame, tier and quality, the encoded images
+    being shared by all the viewers
+    """
+
+    # Tiers and their scale
+    tiers = {"full": 1.0, "half": 0.5, "thumbnail": 0.25}
+
+    def __init__(self, stage_timings: timings.Timings):
+        self.timings: timings.Timings = stage_timings
+        self.lock = threading.Lock()
+
+        # Sequence number of the cached frame, and (tier, quality) -> encoded image
+        self.seq: int = None
+        self.entries: dict = {}
+
+    def get(self, seq: int, image, tier: str = "full", quality: int = 80) -> bytes:
+        """
+        Get the encoded image, encoding it if it is not in the cache yet
+
+        :param int seq: the frame sequence number
+        :param image: the image
+        :param str tier: the tier (full, half or thumbnail)
+        :param int quality: the JPEG quality (0-100)
+        :return bytes: the encoded image
+        """
+        if tier not in self.tiers:
+            tier = "full"
+
+        # Concurrent callers wait for the first one to encode the image
+        with self.lock:
+            if seq != self.seq:
+                self.seq = seq
+                self.entries = {}
+
+            key = (tier, quality)
+            if key not in self.entries:
+                with self.timings.measure("encode"):
+                    scale = self.tiers[tier]
+                    if scale < 1:
+                        image = cv2.resize(
+                            image,
+                            None,
+                            fx=scale,
+                            fy=scale,
+                            interpolation=cv2.INTER_AREA,
+                        )
+                    data = cv2.imencode(
+                        ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality]
+                    )[1]
+                self.entries[key] = data.tobytes()
+
+            return self.entries[key]
+
+
+# Directory the recordings are written to
+recordings_directory = os.path.dirname(__file__) + "/../recordings"
+
+
+class Recorder:
+    """
+    Records frames to a video file from a writer thread, with a sidecar CSV index giving the
+    sequence number and capture timestamp of each recorded frame. Frames are queued without
+    ever blocking, and dropped when the queue is full.
+    """
+
+    def __init__(
+        self, path: str, fps: float = 30, debug: bool = False, depth: int = 30
+    ):
+        """
+        :param str path: the video file path (MJPEG encoded)
+        :param float fps: the nominal frame rate of the video file
+        :param bool debug: whether the debug (annotated) frames are recorded instead of the
+            captured ones
+        :param int depth: the maximum number of frames waiting to be written
+        """
+        self.path: str = path
+        self.index_path: str = os.path.splitext(path)[0] + ".csv"
+        self.fps: float = fps
+        self.debug: bool = debug
+
+        self.queue: queue.Queue = queue.Queue(depth)
+        self.writer: cv2.VideoWriter = None
+        self.size: tuple = None
+
+        # Number of written and dropped frames
+        self.written: int = 0
+        self.dropped: int = 0
+
+        self.running: bool = True
+        self.thread = threading.Thread(
+            target=lambda: self.write(), daemon=True, name="RecorderThread"
+        )
+        self.thread.start()
+
+    def put(self, image, seq: int, timestamp: float):
+        """
+        Queues a frame for recording, dropping it if the queue is full
+
+        :param image: the frame image
+        :param int seq: the frame sequence number
+        :param float timestamp: the frame capture timestamp (monotonic)
+        """
+        try:
+            self.queue.put_nowait((image, seq, timestamp))
+        except queue.Full:
+            self.dropped += 1
+
+    def write(self):
+        """
+        Writer thread
+        """
+        with open(self.index_path, "w") as index:
+            index.write("index,seq,timestamp\n")
+
+            while self.running or not self.queue.empty():
+                try:
+                    image, seq, timestamp = self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if image.ndim < 3 or image.shape[0] == 1:
+                    # Compressed frame
+                    image = cv2.imdecode(image.reshape(-1), cv2.IMREAD_COLOR)
+                    if image is None:
+                        self.dropped += 1
+                        continue
+
+                if self.writer is None:
+                    self.size = (image.shape[1], image.shape[0])
+                    self.writer = cv2.VideoWriter(
+                        self.path,
+                        cv2.VideoWriter_fourcc("M", "J", "P", "G"),
+                        self.fps,
+                        self.size,
+                    )
+                elif (image.shape[1], image.shape[0]) != self.size:
+                    image = cv2.resize(image, self.size)
+
+                self.writer.write(image)
+                index.write(f"{self.written},{seq},{timestamp:.6f}\n")
+                self.written += 1
+
+        if self.writer is not None:
+            self.writer.release()
+
+    def stop(self):
+        """
+        Stops the recording, waiting for the queued frames to be written
+        """
+        self.running = False
+        self.thread.join()
+
+    def stats(self) -> dict:
+        """
+        Recording statistics
+
+        :return dict: file path, written, queued and dropped frames
+        """
+        return {
+            "path": self.path,
+            "debug": self.debug,
+            "written": self.written,
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+class LatencyGovernor:
+    """
+    Lowers the rescale (and optionally the crop) settings in steps when the frames latency
+    exceeds a budget, and raises them back when there is headroom. The adjustments are
+    overrides, the camera settings themselves are left untouched.
+    """
+
+    def __init__(self, window: int = 30):
+        # Latencies of the last frames [s]
+        self.window: int = window
+        self.latencies: list = []
+
+        # Adjustments step [%], headroom ratio below which settings are raised, and minimum
+        # rescale and crop [%]
+        self.step: float = 10
+        self.headroom: float = 0.6
+        self.min_rescale: float = 20
+        self.min_crop: float = 60
+
+        # Overridden rescale, and crop factor applied to crop_x and crop_y [%], and the next
+        # overrides (None if unchanged), waiting to be applied between two frames
+        self.overrides: dict = {}
+        self.pending: dict = None
+
+    def settings(self, settings: dict) -> dict:
+        """
+        Applies the overrides to the camera settings
+
+        :param dict settings: the camera settings
+        :return dict: the settings to use
+        """
+        if not self.overrides:
+            return settings
+
+        settings = settings.copy()
+        if "rescale" in self.overrides:
+            settings["rescale"] = self.overrides["rescale"]
+        if "crop" in self.overrides:
+            settings["crop_x"] = settings["crop_x"] * self.overrides["crop"] / 100.0
+            settings["crop_y"] = settings["crop_y"] * self.overrides["crop"] / 100.0
+
+        return settings
+
+    def update(
+        self, latency: float, settings: dict, budget: float, crop: bool = False
+    ) -> bool:
+        """
+        Accounts for the latency of a frame, and adjusts the overrides if needed
+
+        :param float latency: the frame latency [s]
+        :param dict settings: the camera settings
+        :param float budget: the latency budget [s]
+        :param bool crop: whether the crop can be tightened when the rescale is at its minimum
+        :return bool: whether the overrides should change (see apply)
+        """
+        self.latencies.append(latency)
+        if len(self.latencies) < self.window:
+            return False
+
+        latency = np.percentile(self.latencies, 90)
+        self.latencies = []
+
+        rescale = self.overrides.get("rescale", settings["rescale"])
+        crop_factor = self.overrides.get("crop", 100)
+        overrides = {}
+
+        if latency > budget:
+            if rescale > self.min_rescale:
+                rescale = max(self.min_rescale, rescale - self.step)
+            elif crop and crop_factor > self.min_crop:
+                crop_factor = max(self.min_crop, crop_factor - self.step)
+            else:
+                return False
+        elif latency < budget * self.headroom:
+            if crop_factor < 100:
+                crop_factor = min(100, crop_factor + self.step)
+            elif rescale < settings["rescale"]:
+                rescale = min(settings["rescale"], rescale + self.step)
+            else:
+                return False
+        else:
+            return False
+
+        if rescale < settings["rescale"]:
+            overrides["rescale"] = rescale
+        if crop_factor < 100:
+            overrides["crop"] = crop_factor
+        self.pending = overrides
+
+        return True
+
+    def reset(self) -> bool:
+        """
+        Removes the overrides
+
+        :return bool: whether the overrides should change (see apply)
+        """
+        self.latencies = []
+        if not self.overrides:
+            return False
+
+        self.pending = {}
+        return True
+
+    def apply(self):
+        """
+        Applies the pending overrides
+        """
+        if self.pending is not None:
+            self.overrides, self.pending = self.pending, None
+
+
 class Video:
     """
     Handles video capture from the camera
     """
 
-    def __init__(self):
+    def __init__(self, source=None, realtime: bool = True, name: str = "camera"):
+        """
+        :param source: a frame source (see sources.Source) or its specification (see
+            sources.open_source), the favourite camera is used if None
+        :param bool realtime: whether the source frames are delivered in real time (else,
+            as fast as they are processed)
+        :param str name: the camera name, also used as its configuration entry
+        """
+        self.name: str = name
+        # Frame source (or its specification) and pacing
+        self.source = source
+        self.realtime: bool = realtime
         # Limitting the output period
         self.min_period = 1 / 60
-        # Image retrieve and processing duration
+        # Period of the processed frames, measured where they leave the processing (so that
+        # the serial and pipeline modes report the same), and the time the last one left [s]
         self.period = None
+        self.last_processed: float = None
         # Current capture
         self.capture = None
-        # The last retrieved image
+        # The last retrieved image, and its frame sequence number
         self.image = None
+        self.image_seq: int = None
+        # Number of MJPEG stream viewers for each tier, notified when a new image is available
+        self.viewers: dict = {tier: 0 for tier in JpegCache.tiers}
+        self.image_condition = threading.Condition()
         # Debug output
         self.debug = False
-        # Ask main thread to stop capture
+        # Viewer lease: debug images are only produced if a client retrieved an image
+        # recently (or is streaming)
+        self.lease_duration: float = 5.0
+        self.lease_time: float = None
+        # Ask grab thread to stop capture
         self.should_stop_capture = False
 
+        # Latest grabbed frame, waiting to be processed
+        self.frame: Frame = None
+        self.frame_condition = threading.Condition()
+        # Number of grabbed frames, and frames dropped because a newer one arrived before processing
+        self.grabbed_frames: int = 0
+        self.dropped_frames: int = 0
+
         self.detection = detection.Detection()
 
+        # Adjusts the settings to the latency budget (when the governor option is enabled)
+        self.governor: LatencyGovernor = LatencyGovernor()
+        # The adjustments are applied by the video thread, between two frames
+        self.governor_changed: bool = False
+
+        # Additional cameras, whose detections are merged with this one's (None if there is
+        # a single camera)
+        self.fusion: fusion.Fusion = None
+        self.secondary: dict = {}
+
+        # Shared memory ring the processed frames are published in (None if not used), only
+        # accessed by the thread publishing the frames. Its name and latest sequence number
+        # are kept for the other threads (see get_video).
+        self.frame_ring: frame_ring.FrameRing = None
+        self.frame_ring_status: dict = None
+
+        # Current recording (None if not recording)
+        self.recorder: Recorder = None
+
+        # Durations of the processing stages
+        self.timings: timings.Timings = timings.Timings()
+        self.detection.timings = self.timings
+
+        # Encoded images
+        self.jpeg_cache: JpegCache = JpegCache(self.timings)
+
         self.settings = {
             "brightness": 0,
             "contrast": 0,
@@ -59,43 +418,161 @@ class Video:
             "exposure": -7 if is_windows else 100,
             "focal": 885,
         }
+        # Processing options
+        self.options = {
+            # Process consecutive frames concurrently in pipeline stages
+            "pipeline": False,
+            # Depth of the queues between pipeline stages
+            "pipeline_depth": 1,
+            # Search the ball concurrently with markers detection (when not using the pipeline)
+            "parallel_detection": True,
+            # Search markers only around their predicted positions
+            "marker_tracking": False,
+            # When tracking markers, period of full frame scans [frames]
+            "marker_tracking_rescan": 15,
+            # Search the ball only around its predicted position
+            "ball_windowing": False,
+            # Maximum frame rate of the MJPEG stream
+            "stream_fps": 20,
+            # Quality of the JPEG images (0-100)
+            "jpeg_quality": 80,
+            # Adjust the rescale setting to keep the frames latency within a budget [ms]
+            "governor": False,
+            "governor_budget": 20,
+            # Also tighten the crop when the rescale is at its minimum
+            "governor_crop": False,
+            # Publish the processed frames in a shared memory ring (see FrameRing)
+            "frame_ring": False,
+            "frame_ring_name": "rsk_frames",
+            "frame_ring_slots": 4,
+            # Retrieve the MJPEG frames undecoded from the camera, and decode them directly
+            # at reduced scale (1/2, 1/4 or 1/8) according to the rescale setting
+            "reduced_decode": False,
+        }
+        # Processing pipeline (only used if the "pipeline" option is enabled)
+        self.pipeline: pipeline.Pipeline = None
+        # Worker searching ball candidates while markers are detected
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="BallThread"
+        )
+
         self.favourite_index = None
         self.resolution = len(resolutions) - 1
+        # Height of the delivered frames (before crop and rescale), which may differ from the
+        # requested resolution (frame sources, cameras not supporting it)
+        self.frame_height: int = None
+
+        # Cached list of available cameras (None if not enumerated yet), and the maximum
+        # duration of a camera probe [s]
+        self.cameras_cache: list = None
+        self.cameras_lock = threading.Lock()
+        self.probe_timeout: float = 3.0
 
-        if "camera" in config.config:
-            if "favourite_index" in config.config["camera"]:
-                self.favourite_index = config.config["camera"]["favourite_index"]
-            if "resolution" in config.config["camera"]:
-                self.resolution = config.config["camera"]["resolution"]
-            for entry in config.config["camera"]["settings"]:
-                self.settings[entry] = config.config["camera"]["settings"][entry]
+        if self.name in config.config:
+            camera_config = config.config[self.name]
+            if "favourite_index" in camera_config:
+                self.favourite_index = camera_config["favourite_index"]
+            if "resolution" in camera_config:
+                self.resolution = camera_config["resolution"]
+            for entry in camera_config["settings"]:
+                self.settings[entry] = camera_config["settings"][entry]
+            for entry in camera_config.get("options", {}):
+                self.options[entry] = camera_config["options"][entry]
+        self.apply_options()
 
-        # Starting the video processing thread
+        # Starting the frame grabbing and video processing threads
         self.running = True
+        self.grab_thread = threading.Thread(
+            target=lambda: self.grab(), daemon=True, name="GrabThread"
+        )
+        self.grab_thread.start()
         self.video_thread = threading.Thread(
             target=lambda: self.thread(), daemon=True, name="VideoThread"
         )
         self.video_thread.start()
 
-    def cameras(self) -> list:
+    def camera_candidates(self) -> list:
+        """
+        Lists the camera indexes that may be available, without opening them. On Linux, these
+        are the /dev/video* capture devices (metadata nodes are skipped using sysfs).
+
+        :return list: the candidate indexes
         """
-        Build a list of available cameras
+        if not os.path.isdir("/sys/class/video4linux"):
+            return list(range(10))
+
+        indexes = []
+        for name in os.listdir("/sys/class/video4linux"):
+            if not name.startswith("video") or not name[5:].isdigit():
+                continue
+
+            # Each UVC camera has a capture node (index 0) and a metadata node (index 1)
+            try:
+                with open(f"/sys/class/video4linux/{name}/index") as file:
+                    if int(file.read().strip()) != 0:
+                        continue
+            except (OSError, ValueError):
+                pass
+
+            indexes.append(int(name[5:]))
+
+        return sorted(indexes)
+
+    def probe_camera(self, index: int) -> bool:
+        """
+        Checks that a camera can be opened and delivers frames
+
+        :param int index: the camera index
+        :return bool: whether the camera is available
+        """
+        cap = cv2.VideoCapture(index, cv2.CAP_DSHOW if is_windows else cv2.CAP_ANY)
+        available = cap.read()[0]
+        cap.release()
+
+        return available
 
+    def cameras(self, refresh: bool = False) -> list:
+        """
+        Build a list of available cameras, the candidates are probed in parallel and the
+        result is cached
+
+        :param bool refresh: whether to probe the cameras again instead of using the cache
         :return list: a list containing possible indexes and favourite one (None if no favourite)
         """
-        if self.capture is None:
-            indexes = []
-            for index in range(10):
-                cap = cv2.VideoCapture(index, cv2.CAP_DSHOW if is_windows else None)
-                if cap.read()[0]:
-                    if self.favourite_index is None:
-                        self.favourite_index = index
-                    indexes.append(index)
-                    cap.release()
-
-            return [indexes, self.favourite_index]
-        else:
-            return [[], None]
+        with self.cameras_lock:
+            if self.cameras_cache is None or refresh:
+                # The camera in use can't be probed
+                in_use = None if self.capture is None else self.favourite_index
+                results = {}
+                threads = []
+                for index in self.camera_candidates():
+                    if index == in_use:
+                        results[index] = True
+                        continue
+
+                    thread = threading.Thread(
+                        target=lambda index=index: results.update(
+                            {index: self.probe_camera(index)}
+                        ),
+                        daemon=True,
+                        name=f"CameraProbe-{index}",
+                    )
+                    thread.start()
+                    threads.append(thread)
+
+                # Cameras that did not answer in time are considered unavailable
+                deadline = time.time() + self.probe_timeout
+                for thread in threads:
+                    thread.join(max(0, deadline - time.time()))
+
+                self.cameras_cache = sorted(
+                    index for index, available in list(results.items()) if available
+                )
+
+            if self.favourite_index is None and self.cameras_cache:
+                self.favourite_index = self.cameras_cache[0]
+
+            return [self.cameras_cache, self.favourite_index]
 
     def resolutions(self) -> list:
         """
@@ -111,10 +588,11 @@ class Video:
         """
         Save the configuration
         """
-        config.config["camera"] = {
+        config.config[self.name] = {
             "favourite_index": self.favourite_index,
             "resolution": self.resolution,
             "settings": self.settings,
+            "options": self.options,
         }
         config.save()
 
@@ -141,11 +619,44 @@ class Video:
         self.resolution = resolution
 
         self.apply_camera_settings()
+        self.apply_options()
         self.save_config()
 
         time.sleep(0.1)
         return self.image is not None
 
+    def start_source(self, source) -> bool:
+        """
+        Starts capture from a frame source
+
+        :param source: the source (see sources.Source), or its specification
+        :return bool: whether the capture started
+        """
+        if isinstance(source, str):
+            index = sources.camera_index(source)
+            if index is not None:
+                # Cameras are set up like the favourite one (resolution, format, settings)
+                return self.start_capture(index, self.resolution)
+            source = sources.open_source(source, self.realtime)
+
+        size = getattr(source, "size", None)
+        if size in resolutions:
+            self.resolution = resolutions.index(size)
+
+        self.capture = source
+        self.apply_camera_settings()
+        self.apply_options()
+
+        return True
+
+    def is_realtime(self) -> bool:
+        """
+        Checks whether the current capture delivers frames in real time (cameras do)
+
+        :return bool: False if the frames should be delivered as fast as they are processed
+        """
+        return getattr(self.capture, "realtime", True)
+
     def stop_capture(self) -> None:
         """
         Stop video capture
@@ -159,6 +670,74 @@ class Video:
         self.running = False
         self.stop_capture()
 
+        for video in self.secondary.values():
+            video.stop()
+
+    def add_camera(self, source: str) -> str:
+        """
+        Adds a camera, with its own field calibration and processing threads. The detections
+        of all the cameras are merged in the state, so each camera can see a part of the
+        field only (2 corners are then enough to calibrate).
+
+        :param str source: the frame source (see sources.open_source)
+        :return str: the camera name
+        """
+        if self.fusion is None:
+            self.fusion = fusion.Fusion(self.detection.state)
+            self.detection.state = self.fusion.camera(self.name)
+            self.detection.field.min_corners = 2
+
+        index = 2
+        while f"{self.name}{index}" in self.secondary:
+            index += 1
+        name = f"{self.name}{index}"
+
+        # Cameras are opened by their video thread (see start_source), other sources are
+        # opened here so that errors are reported to the caller
+        if sources.camera_index(source) is None:
+            source = sources.open_source(source, self.realtime)
+        video = Video(source, self.realtime, name)
+        video.detection.state = self.fusion.camera(name)
+        video.detection.referee = self.detection.referee
+        video.detection.field.min_corners = 2
+        self.secondary[name] = video
+
+        return name
+
+    def get_camera(self, name: str = "") -> "Video":
+        """
+        The video of a camera, so that each camera has its own settings and options
+
+        :param str name: the camera name (see add_camera), this camera if empty
+        :return Video: the camera video
+        """
+        if not name or name == self.name:
+            return self
+        if name not in self.secondary:
+            raise ValueError(f"Unknown camera: {name}")
+
+        return self.secondary[name]
+
+    def remove_camera(self, name: str) -> bool:
+        """
+        Removes a camera added with add_camera
+
+        :param str name: the camera name
+        :return bool: whether the camera was removed
+        """
+        if name not in self.secondary:
+            return False
+
+        self.secondary.pop(name).stop()
+        self.fusion.remove(name)
+
+        if not self.secondary:
+            self.detection.state = self.fusion.state
+            self.detection.field.min_corners = 4
+            self.fusion = None
+
+        return True
+
     def apply_camera_settings(self) -> None:
         """
         Use camera settings to set OpenCV properties on capture stream
@@ -173,13 +752,30 @@ class Video:
             self.capture.set(cv2.CAP_PROP_AUTO_EXPOSURE, 1.0)
             self.capture.set(cv2.CAP_PROP_EXPOSURE, self.settings["exposure"])
 
-            if self.resolution is not None:
-                w, h = resolutions[self.resolution]
-                self.detection.field.focal = (
-                    self.settings["focal"]
-                    * (h / 1080)
-                    * (self.settings["rescale"] / 100.0)
-                )
+            self.update_focal()
+
+    def current_settings(self) -> dict:
+        """
+        Camera settings in use, including the latency governor adjustments
+
+        :return dict: the settings
+        """
+        return self.governor.settings(self.settings)
+
+    def update_focal(self):
+        """
+        Updates the field focal according to the height of the delivered frames (or the
+        requested resolution if no frame was delivered yet) and settings
+        """
+        h = self.frame_height
+        if h is None and self.resolution is not None:
+            w, h = resolutions[self.resolution]
+
+        if h is not None:
+            settings = self.current_settings()
+            self.detection.field.set_focal(
+                settings["focal"] * (h / 1080) * (settings["rescale"] / 100.0)
+            )
 
     def set_camera_settings(self, settings: dict):
         """
@@ -191,100 +787,546 @@ class Video:
         self.save_config()
         self.apply_camera_settings()
 
-    def thread(self):
+    def set_option(self, name: str, value):
         """
-        Main video capture thread
+        Set a processing option and save it
+
+        :param str name: option name
+        :param value: option value
         """
-        if self.favourite_index is not None and self.resolution is not None:
-            self.start_capture(self.favourite_index, self.resolution)
+        if name in self.options:
+            self.options[name] = value
+            self.save_config()
+            self.apply_options()
 
-        while self.running:
-            if self.capture is not None:
-                try:
-                    t0 = time.time()
-                    grabbed, image_captured = self.capture.read()
-                    image_debug = None
-
-                    if image_captured is not None:
-                        height, width, channels = image_captured.shape
-                        frame_size = np.array([width, height])
-                        if "crop_x" in self.settings and "crop_y" in self.settings:
-                            if (
-                                self.settings["crop_x"] < 100
-                                or self.settings["crop_y"] < 100
-                            ):
-                                frame_size[0] = round(
-                                    frame_size[0] * self.settings["crop_x"] / 100.0
-                                )
-                                frame_size[1] = round(
-                                    frame_size[1] * self.settings["crop_y"] / 100.0
-                                )
-                                x_offset = round((width - frame_size[0]) / 2.0)
-                                y_offset = round((height - frame_size[1]) / 2.0)
-                                image_captured = image_captured[
-                                    y_offset : y_offset + frame_size[1],
-                                    x_offset : x_offset + frame_size[0],
-                                ]
-
-                        if (
-                            "rescale" in self.settings
-                            and self.settings["rescale"] < 100
-                            and self.settings["rescale"] > 0
-                        ):
-                            new_size = frame_size * self.settings["rescale"] / 100.0
-                            image_captured = cv2.resize(
-                                image_captured,
-                                (int(new_size[0]), int(new_size[1])),
-                                cv2.INTER_LINEAR,
-                            )
+    def apply_options(self):
+        """
+        Passes the processing options to the detection
+        """
+        self.detection.tracking = self.options["marker_tracking"]
+        self.detection.tracking_rescan = self.options["marker_tracking_rescan"]
+        self.detection.ball_windowing = self.options["ball_windowing"]
 
-                        # Process the image
-                        if self.debug:
-                            image_debug = image_captured.copy()
-                        self.detection.detect_markers(image_captured, image_debug)
-                        self.detection.detect_ball(image_captured, image_debug)
-                        self.detection.draw_annotations(image_debug)
-                        self.detection.state.publish()
-
-                    # Computing time
-                    current_period = time.time() - t0
-                    if current_period < self.min_period:
-                        time.sleep(self.min_period - current_period)
-                    current_period = time.time() - t0
-
-                    if self.period is None:
-                        self.period = current_period
-                    else:
-                        self.period = self.period * 0.9 + current_period * 0.1
+        if not self.options["governor"] and self.governor.reset():
+            self.governor_changed = True
 
-                    self.image = (
-                        image_debug if image_debug is not None else image_captured
-                    )
+        if self.capture is not None:
+            self.capture.set(
+                cv2.CAP_PROP_CONVERT_RGB, 0 if self.options["reduced_decode"] else 1
+            )
 
+    def apply_governor(self):
+        """
+        Applies the latency governor adjustments: the focal is updated, and the markers and
+        ball tracking (that rely on pixel positions) are reset
+        """
+        self.governor.apply()
+        self.update_focal()
+        self.detection.reset_tracking()
+
+    def grab(self):
+        """
+        Frame grabbing thread, only keeps the latest frame for processing
+        """
+        while self.running:
+            if self.capture is not None:
+                try:
                     if self.should_stop_capture:
                         self.should_stop_capture = False
                         self.capture.release()
                         del self.capture
                         self.capture = None
+                        with self.frame_condition:
+                            self.frame = None
                         self.image = None
+                        continue
+
+                    # The wait for the next frame depends on the source frame rate, it is
+                    # timed apart from the frame retrieval (and decoding) cost
+                    with self.timings.measure("capture_wait"):
+                        grabbed = self.capture.grab()
+                    timestamp = time.monotonic()
+                    image_captured = None
+                    if grabbed:
+                        with self.timings.measure("retrieve"):
+                            grabbed, image_captured = self.capture.retrieve()
+
+                    if grabbed and image_captured is not None:
+                        with self.frame_condition:
+                            if not self.is_realtime():
+                                # Waiting for the previous frame to be processed
+                                while self.frame is not None and self.running:
+                                    self.frame_condition.wait(0.1)
+                            if self.frame is not None:
+                                # The previous frame was not processed yet, it is now stale
+                                self.dropped_frames += 1
+                            self.grabbed_frames += 1
+                            self.frame = Frame(
+                                image_captured, self.grabbed_frames, timestamp
+                            )
+                            self.frame_condition.notify_all()
+
+                        recorder = self.recorder
+                        if recorder is not None and not recorder.debug:
+                            recorder.put(image_captured, self.grabbed_frames, timestamp)
+                    else:
+                        time.sleep(0.01)
                 except cv2.error as e:
                     print("OpenCV error")
                     print(e)
             else:
                 time.sleep(0.1)
 
-    def get_image(self) -> str:
+        # Releasing the capture, so that the device (or file) can be opened again
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+    def next_frame(self, timeout: float = 0.1) -> Frame:
+        """
+        Waits for the next frame to process
+
+        :param float timeout: maximum waiting duration [s]
+        :return Frame: the frame, or None if no frame arrived
+        """
+        with self.frame_condition:
+            if self.frame is None:
+                self.frame_condition.wait(timeout)
+            frame, self.frame = self.frame, None
+            self.frame_condition.notify_all()
+
+        return frame
+
+    def decode(self, buffer: np.ndarray):
+        """
+        Decodes a compressed (MJPEG) frame, at the smallest scale that is not below the
+        rescale setting (the JPEG decoder can skip the DCT coefficients)
+
+        :param np.ndarray buffer: the compressed frame
+        :return: the decoded image (None on error) and its reduction factor
+        """
+        rescale = self.current_settings().get("rescale", 100) / 100.0
+        for factor, flag in (
+            (8, cv2.IMREAD_REDUCED_COLOR_8),
+            (4, cv2.IMREAD_REDUCED_COLOR_4),
+            (2, cv2.IMREAD_REDUCED_COLOR_2),
+        ):
+            if 0 < rescale <= 1 / factor:
+                return cv2.imdecode(buffer, flag), factor
+
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1
+
+    def prepare(self, frame: Frame) -> bool:
+        """
+        Crops and rescales the frame according to the settings, and prepares the debug image
+
+        :param Frame frame: the frame
+        :return bool: whether the frame could be prepared
+        """
+        t0 = time.perf_counter()
+        settings = self.current_settings()
+        image_captured = frame.image
+        factor = 1
+        if image_captured.ndim < 3 or image_captured.shape[0] == 1:
+            # Compressed frame (the capture is not converting the frames)
+            with self.timings.measure("decode"):
+                image_captured, factor = self.decode(image_captured.reshape(-1))
+            if image_captured is None:
+                return False
+
+        height, width, channels = image_captured.shape
+        frame_size = np.array([width, height]) * factor
+        if frame_size[1] != self.frame_height:
+            self.frame_height = int(frame_size[1])
+            self.update_focal()
+
+        if "crop_x" in settings and "crop_y" in settings:
+            if settings["crop_x"] < 100 or settings["crop_y"] < 100:
+                frame_size[0] = round(frame_size[0] * settings["crop_x"] / 100.0)
+                frame_size[1] = round(frame_size[1] * settings["crop_y"] / 100.0)
+                crop_size = frame_size // factor
+                x_offset = round((width - crop_size[0]) / 2.0)
+                y_offset = round((height - crop_size[1]) / 2.0)
+                image_captured = image_captured[
+                    y_offset : y_offset + crop_size[1],
+                    x_offset : x_offset + crop_size[0],
+                ]
+
+        if (
+            "rescale" in settings
+            and settings["rescale"] < 100
+            and settings["rescale"] > 0
+        ):
+            new_size = (frame_size * settings["rescale"] / 100.0).astype(int)
+            if image_captured.shape[1] != new_size[0] or (
+                image_captured.shape[0] != new_size[1]
+            ):
+                image_captured = cv2.resize(
+                    image_captured,
+                    (int(new_size[0]), int(new_size[1])),
+                    cv2.INTER_LINEAR,
+                )
+
+        frame.image = image_captured
+        recorder = self.recorder
+        if (self.debug and self.watched()) or (recorder is not None and recorder.debug):
+            frame.image_debug = image_captured.copy()
+
+        self.timings.add("crop_rescale", time.perf_counter() - t0)
+        return True
+
+    def process_markers(self, frame: Frame) -> Frame:
+        frame.markers = self.detection.find_markers(frame.image, frame.image_debug)
+        return frame
+
+    def process_ball(self, frame: Frame) -> Frame:
+        frame.ball = self.detection.find_ball(frame.image, frame.image_debug)
+        return frame
+
+    def process_detection(self, frame: Frame) -> Frame:
+        """
+        Detects markers and ball, the ball candidates being searched in another thread meanwhile
+        (OpenCV releases the GIL)
+        """
+        candidates = self.executor.submit(self.detection.ball_candidates, frame.image)
+        frame.markers = self.detection.find_markers(frame.image, frame.image_debug)
+        frame.ball = self.detection.select_ball(candidates.result(), frame.image_debug)
+        return frame
+
+    def process_publish(self, frame: Frame) -> Frame:
+        with self.timings.measure("annotations"):
+            self.detection.draw_annotations(frame.image_debug)
+
+        with self.timings.measure("publish"):
+            self.detection.state.set_markers(frame.markers, frame.seq, frame.timestamp)
+            self.detection.state.set_ball(frame.ball, frame.seq, frame.timestamp)
+            self.detection.state.publish()
+
+        # Time between the frame capture and the publication of its detection
+        latency = time.monotonic() - frame.timestamp
+        self.timings.add("latency", latency)
+
+        if self.options["governor"] and self.governor.update(
+            latency,
+            self.settings,
+            self.options["governor_budget"] / 1000.0,
+            self.options["governor_crop"],
+        ):
+            self.governor_changed = True
+
+        self.publish_frame(frame)
+        self.frame_processed(frame)
+
+        recorder = self.recorder
+        if recorder is not None and recorder.debug and frame.image_debug is not None:
+            recorder.put(frame.image_debug, frame.seq, frame.timestamp)
+
+        if self.capture is not None:
+            with self.image_condition:
+                self.image = (
+                    frame.image_debug if frame.image_debug is not None else frame.image
+                )
+                self.image_seq = frame.seq
+                self.image_condition.notify_all()
+        return frame
+
+    def frame_processed(self, frame: Frame):
+        """
+        Accounts a frame leaving the processing, updating the processing duration and the
+        frames period
+
+        :param Frame frame: the frame
+        """
+        now = time.time()
+        if frame.started is not None:
+            self.timings.add("processing", now - frame.started)
+
+        # Longer intervals are pauses (no capture), rather than processing periods
+        if self.last_processed is not None and now - self.last_processed < 1:
+            current_period = now - self.last_processed
+            if self.period is None:
+                self.period = current_period
+            else:
+                self.period = self.period * 0.9 + current_period * 0.1
+        self.last_processed = now
+
+    def publish_frame(self, frame: Frame):
+        """
+        Publishes the processed frame in the shared memory ring (if enabled), the ring is
+        created again when the frames shape changes
+
+        :param Frame frame: the frame
+        """
+        ring = self.frame_ring
+        if not self.options["frame_ring"]:
+            self.close_frame_ring()
+            return
+
+        with self.timings.measure("frame_ring"):
+            shape = (
+                frame.image.shape if frame.image.ndim == 3 else (*frame.image.shape, 1)
+            )
+            if ring is None or ring.shape != shape:
+                self.close_frame_ring()
+                ring = frame_ring.FrameRing(
+                    self.options["frame_ring_name"],
+                    shape,
+                    self.options["frame_ring_slots"],
+                )
+                self.frame_ring = ring
+
+            seq = ring.write(frame.image, frame.timestamp, frame.seq)
+            self.frame_ring_status = {"name": ring.name, "seq": seq}
+
+    def close_frame_ring(self):
+        """
+        Closes the shared memory ring, it is cleared before being closed
+        """
+        self.frame_ring_status = None
+        ring, self.frame_ring = self.frame_ring, None
+        if ring is not None:
+            ring.close()
+
+    def process_encode(self, frame: Frame) -> Frame:
+        # Encoding ahead of time the tiers watched by stream viewers
+        if self.image_seq == frame.seq:
+            for tier in self.viewers:
+                if self.viewers[tier] > 0:
+                    self.get_jpeg(tier)
+        return frame
+
+    def renew_lease(self):
+        """
+        Renews the viewer lease, called when a client retrieves an image
+        """
+        self.lease_time = time.monotonic()
+
+    def watched(self) -> bool:
+        """
+        Checks whether a client is watching the images
+
+        :return bool: True if a client is streaming or retrieved an image recently
+        """
+        if sum(self.viewers.values()) > 0:
+            return True
+
+        return (
+            self.lease_time is not None
+            and time.monotonic() - self.lease_time < self.lease_duration
+        )
+
+    def get_jpeg(self, tier: str = "full") -> bytes:
+        """
+        Get the current image, JPEG encoded
+
+        :param str tier: the tier (full, half or thumbnail)
+        :return bytes: the encoded image, None if there is no image
+        """
+        with self.image_condition:
+            image, seq = self.image, self.image_seq
+
+        if image is None:
+            return None
+
+        return self.jpeg_cache.get(seq, image, tier, self.options["jpeg_quality"])
+
+    def update_pipeline(self):
+        """
+        Starts or stops the processing pipeline according to the options
+        """
+        if self.options["pipeline"] and self.pipeline is None:
+            self.pipeline = pipeline.Pipeline(
+                [
+                    ("markers", self.process_markers),
+                    ("ball", self.process_ball),
+                    ("publish", self.process_publish),
+                    ("encode", self.process_encode),
+                ],
+                self.options["pipeline_depth"],
+            )
+        elif not self.options["pipeline"] and self.pipeline is not None:
+            # Waiting for the frames in flight, so that frames are published by a single
+            # thread at a time
+            self.pipeline.stop()
+            self.pipeline.join()
+            self.pipeline = None
+
+        if self.pipeline is not None:
+            # Real-time frames are dropped rather than queued, like in the grab thread
+            self.pipeline.set_latest(self.is_realtime())
+
+    def thread(self):
+        """
+        Main video processing thread
+        """
+        if self.source is not None:
+            self.start_source(self.source)
+        elif self.favourite_index is not None and self.resolution is not None:
+            self.start_capture(self.favourite_index, self.resolution)
+
+        if self.source is None:
+            # Enumerating the cameras in the background, so that the list is ready when
+            # the camera tab is opened
+            threading.Thread(
+                target=lambda: self.cameras(), daemon=True, name="CamerasThread"
+            ).start()
+
+        while self.running:
+            if self.detection.state is None:
+                # Waiting for the state the detections are published in
+                time.sleep(0.01)
+                continue
+
+            frame = self.next_frame()
+            if frame is None:
+                continue
+
+            try:
+                t0 = time.time()
+                frame.started = t0
+                self.update_pipeline()
+                if self.governor_changed:
+                    self.governor_changed = False
+                    self.apply_governor()
+                if not self.prepare(frame):
+                    continue
+
+                if self.pipeline is not None:
+                    # Frames are processed by the pipeline threads, this replaces the frame
+                    # pending in the first stage (or waits for room, for non real-time sources)
+                    self.pipeline.push(frame)
+                else:
+                    if self.options["parallel_detection"]:
+                        self.process_detection(frame)
+                    else:
+                        self.process_markers(frame)
+                        self.process_ball(frame)
+                    self.process_publish(frame)
+
+                # Limitting the frames rate
+                current_period = time.time() - t0
+                if current_period < self.min_period and self.is_realtime():
+                    time.sleep(self.min_period - current_period)
+            except cv2.error as e:
+                print("OpenCV error")
+                print(e)
+
+        # Releasing the pipeline and the frames ring from this thread, once no frame is
+        # processed anymore
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline.join()
+            self.pipeline = None
+        self.close_frame_ring()
+
+    def get_image(self, tier: str = "full") -> str:
         """
         Get the current image
 
+        :param str tier: the tier (full, half or thumbnail)
         :return str: the image contents (base64 encoded)
         """
-        if self.image is not None:
-            data = cv2.imencode(".jpg", self.image)
-            return base64.b64encode(data[1]).decode("utf-8")
+        self.renew_lease()
+        data = self.get_jpeg(tier)
+        if data is not None:
+            return base64.b64encode(data).decode("utf-8")
         else:
             return ""
 
+    def stream(self, tier: str = "full"):
+        """
+        Generates a multipart MJPEG stream of the processed images, fed by the video thread
+
+        :param str tier: the tier (full, half or thumbnail)
+        :return: a generator of multipart chunks
+        """
+        if tier not in self.viewers:
+            tier = "full"
+
+        with self.image_condition:
+            self.viewers[tier] += 1
+
+        try:
+            last_seq = None
+            last_sent = 0
+            while self.running:
+                with self.image_condition:
+                    self.image_condition.wait(1.0)
+                    seq = self.image_seq
+
+                # Limiting the stream frame rate
+                if (
+                    seq == last_seq
+                    or time.time() - last_sent < 1 / self.options["stream_fps"]
+                ):
+                    continue
+
+                self.renew_lease()
+                data = self.get_jpeg(tier)
+                if data is not None:
+                    last_seq = seq
+                    last_sent = time.time()
+                    yield (
+                        b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+                        % len(data)
+                    ) + data + b"\r\n"
+        finally:
+            with self.image_condition:
+                self.viewers[tier] -= 1
+
+    def start_recording(self, name: str = "", debug: bool = False) -> bool:
+        """
+        Starts recording the frames, in the recordings directory (next to the configuration
+        file). Only a file name is accepted, so that API callers can not write elsewhere.
+
+        :param str name: the video file name (the .avi extension is added if missing),
+            defaults to a timestamped name. Existing files are not overwritten.
+        :param bool debug: whether the debug (annotated) frames are recorded instead of the
+            captured ones
+        :return bool: whether the recording started
+        """
+        if self.recorder is not None or self.capture is None:
+            return False
+
+        if not name:
+            name = time.strftime("recording-%Y%m%d-%H%M%S")
+        # Path separators, drive letters and parent or hidden names are rejected
+        if any(char in name for char in "/\\:") or name.startswith(".") or ".." in name:
+            return False
+        if not name.endswith(".avi"):
+            name += ".avi"
+
+        path = os.path.join(recordings_directory, name)
+        index_path = os.path.splitext(path)[0] + ".csv"
+        if os.path.exists(path) or os.path.exists(index_path):
+            return False
+        os.makedirs(recordings_directory, exist_ok=True)
+
+        fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+        self.recorder = Recorder(path, fps, debug)
+        return True
+
+    def stop_recording(self) -> dict:
+        """
+        Stops the recording
+
+        :return dict: the recording statistics (see Recorder.stats), None if not recording
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return None
+
+        recorder.stop()
+        return recorder.stats()
+
+    def get_timings(self) -> dict:
+        """
+        Get statistics about the processing stages durations
+
+        :return dict: percentiles (p50, p95, p99) and max durations [ms] for each stage
+        """
+        return self.timings.stats()
+
     def get_video(self, with_image: bool) -> dict:
         """
         Get the video status
@@ -295,6 +1337,32 @@ class Video:
         data = {
             "running": self.capture is not None,
             "fps": round(1 / self.period, 1) if self.period is not None else 0,
+            "grabbed_frames": self.grabbed_frames,
+            "dropped_frames": self.dropped_frames,
+            "pipeline": None if self.pipeline is None else self.pipeline.stats(),
+            "viewers": dict(self.viewers),
+            "recording": None if self.recorder is None else self.recorder.stats(),
+            "frame_ring": self.frame_ring_status,
+            "governor": self.governor.overrides,
+            "cameras": {
+                name: {
+                    "running": video.capture is not None,
+                    "fps": (
+                        round(1 / video.period, 1) if video.period is not None else 0
+                    ),
+                    "calibrated": video.detection.field.calibrated(),
+                }
+                for name, video in self.secondary.items()
+            },
+            "lease": {
+                "debug": self.debug,
+                "watched": self.watched(),
+                "age": (
+                    None
+                    if self.lease_time is None
+                    else round(time.monotonic() - self.lease_time, 1)
+                ),
+            },
             "detection": self.detection.get_detection(),
         }
 